@@ -0,0 +1,63 @@
+# Compare the previous regex extraction of the GetFeatureInfo values with
+# the parsers of featureinfo on recorded answers:
+#   PYTHONPATH=src python sandbox/bench_featureinfo.py
+import json
+import math
+import re
+import timeit
+
+import featureinfo
+
+LAYER = "REPS.DIAG.3_PRMM.ERGE5"
+
+TEXT = f"""GetFeatureInfo results:
+
+Layer '{LAYER}'
+  Feature 0: 
+    x = '-123.116'
+    y = '49.288'
+    value_0 = '42.5'
+""".encode()
+
+TEXT_NODATA = f"""GetFeatureInfo results:
+
+Layer '{LAYER}'
+""".encode()
+
+GEOJSON = json.dumps(
+    {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": {"x": "-123.116", "y": "49.288", "value_0": "42.5"},
+            }
+        ],
+    }
+).encode()
+
+
+# Extraction used by fetch_data before the featureinfo module
+def previous(content: bytes) -> float:
+    value = str(re.findall(r"value_0\s+\d*.*\d+", content.decode("utf-8")))
+    return float(re.sub("value_0 = '", "", value).strip('[""]'))
+
+
+assert previous(TEXT) == 42.5
+assert featureinfo.parse(TEXT, featureinfo.TEXT, [LAYER]) == {LAYER: 42.5}
+assert featureinfo.parse(GEOJSON, featureinfo.JSON, [LAYER]) == {LAYER: 42.5}
+assert math.isnan(featureinfo.parse(TEXT_NODATA, featureinfo.TEXT, [LAYER])[LAYER])
+try:
+    previous(TEXT_NODATA)
+    print("previous regex: nodata parsed")
+except ValueError:
+    print("previous regex: nodata raises ValueError")
+
+NUMBER = 100_000
+for name, function in [
+    ("previous regex", lambda: previous(TEXT)),
+    ("text/plain", lambda: featureinfo.parse(TEXT, featureinfo.TEXT, [LAYER])),
+    ("application/json", lambda: featureinfo.parse(GEOJSON, featureinfo.JSON, [LAYER])),
+]:
+    elapsed = min(timeit.repeat(function, number=NUMBER, repeat=3))
+    print(f"{name:<17} {elapsed / NUMBER * 1e6:6.2f} us per answer")
@@ -0,0 +1,31 @@
+# Compare the sequential and concurrent GetFeatureInfo fetch against
+# the local stand-in WMS:
+#   PYTHONPATH=src:sandbox python sandbox/bench_fetch.py
+from datetime import datetime, timedelta
+import time
+
+from fetch_data import RequestInput, request
+from geomet import GeoMetClient
+import stand_in_wms
+
+server = stand_in_wms.serve()
+timesteps = [datetime(2024, 5, 13, 0) + timedelta(hours=3 * i) for i in range(48)]
+
+for workers in (1, 8, 16):
+    request_input = RequestInput(
+        layers=["REPS.DIAG.3_PRMM.ERGE5"],
+        time=timesteps,
+        min_x=-123.366,
+        min_y=49.038,
+        max_x=-122.866,
+        max_y=49.538,
+        client=GeoMetClient(url=stand_in_wms.url(server), workers=workers),
+    )
+    start = time.perf_counter()
+    values = request(request_input)["REPS.DIAG.3_PRMM.ERGE5"]
+    elapsed = time.perf_counter() - start
+    request_input.client.close()
+    assert values == [float(t.hour) for t in timesteps]
+    print(f"workers={workers:>2}: {len(values)} timesteps in {elapsed:.2f} s")
+
+server.shutdown()
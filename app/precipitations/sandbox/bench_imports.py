@@ -0,0 +1,42 @@
+# Import time of each stage module, measured in a fresh interpreter:
+#   PYTHONPATH=src python sandbox/bench_imports.py
+# Exits with an error when a module takes longer than its budget,
+# which usually means a heavy dependency is imported at module level.
+import subprocess
+import sys
+
+# Budget in seconds per module
+BUDGETS = {
+    "fetch_data": 0.3,
+    "prediction": 0.3,
+    "profit": 0.1,
+    "stac": 0.1,
+    "pipeline": 0.4,
+}
+RUNS = 5
+
+CODE = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+failed = False
+for module, budget in BUDGETS.items():
+    elapsed = min(
+        float(
+            subprocess.run(
+                [sys.executable, "-c", CODE.format(module=module)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+        )
+        for _ in range(RUNS)
+    )
+    status = "ok" if elapsed <= budget else "OVER BUDGET"
+    failed = failed or elapsed > budget
+    print(f"{module:<12} {elapsed * 1000:7.1f} ms (budget {budget * 1000:.0f} ms) {status}")
+
+sys.exit(1 if failed else 0)
@@ -0,0 +1,63 @@
+# Cost of writing and reading the values exchanged between the stages as
+# values.json and as values.npz, for a batch run of many locations:
+#   PYTHONPATH=src python sandbox/bench_interchange.py [locations]
+from datetime import datetime, timedelta
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+
+from dataio import load_values, parse_times, save_values
+
+LOCATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+TIMESTEPS = 64
+
+local_time = [datetime(2024, 5, 13, 0) + timedelta(hours=3 * i) for i in range(TIMESTEPS)]
+rng = numpy.random.default_rng(0)
+data = {
+    "local_time": [t.strftime("%Y-%m-%d %H:%M:%S") for t in local_time],
+    "open_hours": [t.strftime("%Y-%m-%d %H:%M:%S") for t in local_time if 9 < t.hour < 21],
+    "locations": [{"name": f"p{i}", "x": -123.0, "y": 49.0} for i in range(LOCATIONS)],
+    "pixel_value": numpy.round(rng.uniform(0, 100, (LOCATIONS, TIMESTEPS)), 1).tolist(),
+    "cumulative_profit": numpy.cumsum(
+        rng.integers(0, 300, (LOCATIONS, TIMESTEPS)), axis=1
+    ).astype(float).tolist(),
+    "interval": 3,
+    "layer": "REPS.DIAG.3_PRMM.ERGE5",
+    "bbox": [-123.5, 48.5, -122.5, 49.5],
+    "start_time": "2024-05-13 07:00:00",
+    "end_time": "2024-05-21 04:00:00",
+}
+print(f"{LOCATIONS} locations x {TIMESTEPS} timesteps ({LOCATIONS * TIMESTEPS} values)")
+
+directory = tempfile.mkdtemp()
+for name in ["values.json", "values.npz"]:
+    path = os.path.join(directory, name)
+    start = time.perf_counter()
+    save_values(data, path)
+    written = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if name.endswith(".npz"):
+        loaded = load_values(path)
+    else:
+        import json
+
+        with open(path) as file:
+            loaded = json.load(file)
+    read = time.perf_counter() - start
+
+    # What a downstream stage does first: timesteps and values as arrays
+    start = time.perf_counter()
+    parse_times(loaded["local_time"])
+    numpy.asarray(loaded["pixel_value"], dtype=float)
+    numpy.asarray(loaded["cumulative_profit"], dtype=float)
+    parsed = time.perf_counter() - start
+
+    size = os.path.getsize(path) / 1e6
+    print(
+        f"{name:<12} {size:7.1f} MB  write {written * 1000:7.1f} ms  "
+        f"read {read * 1000:7.1f} ms  to arrays {parsed * 1000:7.1f} ms"
+    )
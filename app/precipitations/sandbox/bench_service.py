@@ -0,0 +1,38 @@
+# Latency of the forecast service against the stand-in WMS, for the first
+# (cold) and the following (warm) lookups of a few points:
+#   PYTHONPATH=src:sandbox python sandbox/bench_service.py
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import requests
+
+import stand_in_wms
+
+wms = stand_in_wms.serve(delay=0.05)
+os.environ["GEOMET_URL"] = stand_in_wms.url(wms)
+os.environ["CACHE_DIR"] = tempfile.mkdtemp()
+
+import service  # noqa: E402 (reads GEOMET_URL and CACHE_DIR)
+
+server = service.serve(port=0)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+url = f"http://127.0.0.1:{server.server_address[1]}/forecast"
+
+points = [(-123.116 + i * 0.1, 49.288) for i in range(5)]
+session = requests.Session()
+for name in ["cold", "warm"]:
+    latencies = []
+    for x, y in points:
+        start = time.perf_counter()
+        response = session.get(url, params={"x": x, "y": y})
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(f"{name}: median {statistics.median(latencies):.1f} ms, max {max(latencies):.1f} ms")
+
+print(f"WMS requests: {wms.requests}, cache hits: {server.service.cache.hits}")
+print(session.get(url, params={"x": "a"}).status_code, "on invalid coordinates")
+server.shutdown()
+wms.shutdown()
@@ -0,0 +1,64 @@
+# Fetch against a stand-in WMS injecting slow answers and errors, with
+# and without the retries and hedged requests of GeoMetClient, then
+# against answers trickling past the deadline:
+#   PYTHONPATH=src:sandbox python sandbox/bench_tail_latency.py
+from datetime import datetime, timedelta
+import logging
+import time
+
+from fetch_data import RequestInput, request
+from geomet import GeoMetClient
+import stand_in_wms
+
+logging.basicConfig(level=logging.ERROR)
+
+LAYER = "REPS.DIAG.3_PRMM.ERGE5"
+timesteps = [datetime(2024, 5, 13, 0) + timedelta(hours=3 * i) for i in range(200)]
+
+# 5% of the answers take 2 s and 5% are 503 errors
+faulty = stand_in_wms.serve(delay=0.02, error_rate=0.05, slow_rate=0.05, slow_delay=2)
+# No fault: hedging must not double the load behind the rate limiter
+healthy = stand_in_wms.serve(delay=0.02)
+# 2% of the answers trickle 8 bytes every 0.5 s, never done within 2 s
+trickling = stand_in_wms.serve(delay=0.02, trickle_rate=0.02, trickle_delay=0.5)
+
+for name, server, options in [
+    ("no retry", faulty, dict(retries=0)),
+    ("retries", faulty, dict(retries=3, backoff=0.05)),
+    ("retries + hedging p90", faulty, dict(retries=3, backoff=0.05, hedge_percentile=90)),
+    ("retries + hedging p90 + 100 req/s", faulty, dict(
+        retries=3, backoff=0.05, hedge_percentile=90, rate_limit=100
+    )),
+    ("no fault, hedging p90", healthy, dict(hedge_percentile=90)),
+    ("no fault, hedging p90 + 100 req/s", healthy, dict(
+        hedge_percentile=90, rate_limit=100
+    )),
+    ("trickling, 2 s deadline", trickling, dict(retries=3, backoff=0.05, timeout=2)),
+]:
+    options = {"timeout": 5, **options}
+    server.requests = 0
+    client = GeoMetClient(url=stand_in_wms.url(server), workers=8, **options)
+    request_input = RequestInput(
+        layers=[LAYER],
+        time=timesteps,
+        min_x=-123.366,
+        min_y=49.038,
+        max_x=-122.866,
+        max_y=49.538,
+        client=client,
+    )
+    start = time.perf_counter()
+    try:
+        request(request_input)
+        result = "ok"
+    except Exception as error:
+        result = f"failed ({type(error).__name__})"
+    elapsed = time.perf_counter() - start
+    client.close()
+    print(
+        f"{name:<35} {elapsed:5.2f} s, {server.requests:3d} requests, "
+        f"{client.hedges:3d} hedged: {result}"
+    )
+
+for server in (faulty, healthy, trickling):
+    server.shutdown()
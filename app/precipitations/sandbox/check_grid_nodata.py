@@ -0,0 +1,37 @@
+# Check that the pixels without data of the coverages are left out of the
+# regional aggregates of the gridded mode, against the local stand-in WMS
+# (whose last column is nodata):
+#   PYTHONPATH=src:sandbox python sandbox/check_grid_nodata.py
+from datetime import datetime, timedelta
+
+import numpy
+
+from geomet import GeoMetClient
+from prediction import AREA_THRESHOLD, regional_aggregates
+from raster import CubeRequestInput, request_cube
+import stand_in_wms
+
+server = stand_in_wms.serve(delay=0)
+timesteps = [datetime(2024, 5, 13, 0) + timedelta(hours=3 * i) for i in range(8)]
+client = GeoMetClient(url=stand_in_wms.url(server))
+cube = request_cube(
+    CubeRequestInput(
+        layer="REPS.DIAG.3_PRMM.ERGE5",
+        time=timesteps,
+        bbox=(-123.5, 49, -123, 49.5),
+        client=client,
+    )
+)
+client.close()
+server.shutdown()
+
+assert numpy.isnan(cube[..., -1]).all() and not numpy.isnan(cube[..., :-1]).any()
+# A chunk smaller than the cube so that several blocks are aggregated
+aggregates = regional_aggregates(cube, chunk=3)
+valid = cube[..., :-1].reshape(len(cube), -1).astype(float)
+assert numpy.array_equal(aggregates["max"], valid.max(axis=1))
+assert numpy.allclose(aggregates["mean"], valid.mean(axis=1))
+assert numpy.allclose(
+    aggregates["area_fraction"], (valid > AREA_THRESHOLD).mean(axis=1)
+)
+print(f"{cube.shape} cube with {int(numpy.isnan(cube).sum())} nodata pixels: ok")
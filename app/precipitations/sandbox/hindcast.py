@@ -0,0 +1,27 @@
+# Compare the archived model runs of a location and the total profits
+# the prediction model anticipated with each of them, without fetching:
+#   PYTHONPATH=src python sandbox/hindcast.py archive van
+import sys
+
+import numpy
+
+from archive import ForecastArchive
+from business_hours import TIME_ZONE
+from prediction import cumulative_profit
+
+LAYER = "REPS.DIAG.3_PRMM.ERGE5"
+
+archive_dir, location = sys.argv[1], sys.argv[2]
+archive = ForecastArchive(LAYER, archive_dir)
+runs, times, values = archive.runs(location)
+local_time = (times + numpy.timedelta64(int(TIME_ZONE * 3600), "s")).astype(object)
+# The nights are not fetched, the interval is the smallest gap
+interval = int(numpy.diff(times).min() / numpy.timedelta64(1, "h")) if len(times) > 1 else 1
+
+for run, probability in zip(runs, values):
+    known = ~numpy.isnan(probability)
+    profit = cumulative_profit(local_time[known], probability[known], interval)
+    print(
+        f"{run}: {known.sum()} timesteps, mean probability "
+        f"{probability[known].mean():.1f} %, total profit {profit[-1]:.2f} $"
+    )
@@ -0,0 +1,197 @@
+# Local stand-in for the GeoMet WMS service, used to try the
+# fetch code without reaching geo.weather.gc.ca
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlparse
+import json
+import random
+import threading
+import time
+
+import numpy
+from PIL import Image, TiffImagePlugin, TiffTags
+
+# Seconds waited before each answer, to mimic the GeoMet latency
+DELAY = 0.05
+
+FEATURE_INFO = """
+Layer '{layer}'
+  Feature 0: 
+    x = '-123.116'
+    y = '49.288'
+    value_0 = '{value}'
+"""
+
+CAPABILITIES = """<?xml version="1.0" encoding="UTF-8"?>
+<WMS_Capabilities version="1.3.0" xmlns="http://www.opengis.net/wms">
+  <Capability>
+    <Layer>
+      <Title>MSC GeoMet</Title>
+      <Layer queryable="1">
+        <Name>{layer}</Name>
+        <BoundingBox CRS="EPSG:4326" minx="40" miny="-140" maxx="60" maxy="-110" resx="0.1" resy="0.1"/>
+        <Dimension name="reference_time" units="ISO8601">2024-05-13T00:00:00Z</Dimension>
+        <Dimension name="time" units="ISO8601" nearestValue="0">2024-05-13T03:00:00Z/2024-05-21T00:00:00Z/PT3H</Dimension>
+      </Layer>
+    </Layer>
+  </Capability>
+</WMS_Capabilities>
+"""
+ETAG = '"stand-in-1"'
+# Value of the pixels without data of the coverages (GDAL nodata tag)
+NODATA = -9999
+# Thresholds (mm) of the published exceedance layers
+EXCEEDANCE = "REPS.DIAG.3_PRMM.ERGE"
+THRESHOLDS = ("1", "5", "10", "25")
+# Capabilities asked for a layer that is not published
+NO_LAYER = """<?xml version="1.0" encoding="UTF-8"?>
+<WMS_Capabilities version="1.3.0" xmlns="http://www.opengis.net/wms">
+  <Capability>
+    <Layer>
+      <Title>MSC GeoMet</Title>
+    </Layer>
+  </Capability>
+</WMS_Capabilities>
+"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        query = {k.upper(): v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests += 1
+        # Injected faults: slow answers and server errors
+        if random.random() < self.server.slow_rate:
+            time.sleep(self.server.slow_delay)
+        else:
+            time.sleep(self.server.delay)
+        if random.random() < self.server.error_rate:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if query.get("REQUEST") == "GetCapabilities":
+            if self.headers.get("If-None-Match") == ETAG:
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            layer = query.get("LAYER", "")
+            if layer.startswith(EXCEEDANCE) and layer[len(EXCEEDANCE):] not in THRESHOLDS:
+                body = NO_LAYER.encode()
+            else:
+                body = CAPABILITIES.format(layer=layer).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml")
+            self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        # The value depends on the hour so that the ordering can be checked
+        hour = int(query.get("TIME", "T00")[11:13] or 0)
+        if query.get("REQUEST") in ("GetMap", "GetCoverage"):
+            if query["REQUEST"] == "GetMap":
+                width, height = int(query["WIDTH"]), int(query["HEIGHT"])
+            else:
+                # SCALESIZE=x(width),y(height)
+                width, height = (
+                    int(axis.split("(")[1].rstrip(")"))
+                    for axis in query["SCALESIZE"].split("),")
+                )
+            # Each pixel is worth hour * 1000 + row
+            rows = numpy.arange(height, dtype=numpy.float32)[:, None]
+            raster = numpy.ascontiguousarray(
+                numpy.broadcast_to(hour * 1000 + rows, (height, width))
+            )
+            buffer = BytesIO()
+            if query["REQUEST"] == "GetMap":
+                # Rendered with a style, like the images of GeoMet
+                colors = numpy.zeros((height, width, 4), dtype=numpy.uint8)
+                colors[..., 2] = raster % 256
+                colors[..., 3] = 255
+                Image.fromarray(colors, mode="RGBA").save(buffer, "PNG")
+                content_type = "image/png"
+            else:
+                # Values of the coverage in a float GeoTIFF, the last
+                # column being out of the model domain
+                raster[:, -1] = NODATA
+                info = TiffImagePlugin.ImageFileDirectory_v2()
+                info[42113] = str(NODATA)
+                info.tagtype[42113] = TiffTags.ASCII
+                Image.fromarray(raster, mode="F").save(buffer, "TIFF", tiffinfo=info)
+                content_type = "image/tiff"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(buffer.tell()))
+            self.end_headers()
+            self.wfile.write(buffer.getvalue())
+            return
+        layers = query.get("QUERY_LAYERS", "").split(",")
+        if query.get("INFO_FORMAT") == "application/json":
+            content_type = "application/json"
+            body = json.dumps(
+                {
+                    "type": "FeatureCollection",
+                    "features": [
+                        {
+                            "type": "Feature",
+                            "properties": {"layer": layer, "value_0": str(float(hour))},
+                        }
+                        for layer in layers
+                    ],
+                }
+            )
+        else:
+            content_type = "text/plain"
+            body = "GetFeatureInfo results:\n" + "".join(
+                FEATURE_INFO.format(layer=layer, value=float(hour)) for layer in layers
+            )
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.write_body(body)
+
+    # Injected fault: a few bytes at a time, each read of the client
+    # gets data before its socket timeout but the answer never ends in time
+    def write_body(self, body: bytes) -> None:
+        if random.random() >= self.server.trickle_rate:
+            self.wfile.write(body)
+            return
+        try:
+            for start in range(0, len(body), 8):
+                self.wfile.write(body[start:start + 8])
+                self.wfile.flush()
+                time.sleep(self.server.trickle_delay)
+        except OSError:
+            pass
+
+
+def serve(
+    delay: float = DELAY,
+    error_rate: float = 0,
+    slow_rate: float = 0,
+    slow_delay: float = 2,
+    trickle_rate: float = 0,
+    trickle_delay: float = 0.5,
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.delay = delay
+    server.error_rate = error_rate
+    server.slow_rate = slow_rate
+    server.slow_delay = slow_delay
+    server.trickle_rate = trickle_rate
+    server.trickle_delay = trickle_delay
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def url(server: ThreadingHTTPServer) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/geomet"
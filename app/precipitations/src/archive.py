@@ -0,0 +1,159 @@
+# Importation of Python modules
+from datetime import datetime
+from typing import Optional
+import json
+import logging
+import os
+
+# The following modules must first be installed to use
+# this code out of Jupyter Notebook
+import numpy
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join("./", "archive"))
+
+# Fixed-width record of one fetched value
+RECORD = numpy.dtype(
+    [
+        ("reference_time", "<M8[s]"),
+        ("time", "<M8[s]"),
+        ("value", "<f4"),
+    ]
+)
+
+
+def _datetime64(value) -> numpy.datetime64:
+    if isinstance(value, str):
+        value = value.rstrip("Z")
+    return numpy.datetime64(value, "s")
+
+
+# Append-only archive of the values fetched for a layer, kept across runs
+# to compare the model runs and backtest the profit model.
+# The values are fixed-width records appended to <layer>.records, read back
+# memory-mapped. <layer>.index.ndjson holds one line per model run and
+# location with the position of its records.
+class ForecastArchive:
+    def __init__(self, layer: str, archive_dir: str = ARCHIVE_DIR):
+        os.makedirs(archive_dir, exist_ok=True)
+        self.layer = layer
+        self.records_path = os.path.join(archive_dir, f"{layer}.records")
+        self.index_path = os.path.join(archive_dir, f"{layer}.index.ndjson")
+        # Index entries in the order of the file, by model run and
+        # location, and by location
+        self.entries: list[dict] = []
+        self.by_key: dict[tuple[str, str], dict] = {}
+        self.by_location: dict[str, list[dict]] = {}
+        for entry in self._read_index():
+            self._add_entry(entry)
+
+    def _read_index(self) -> list[dict]:
+        try:
+            with open(self.index_path) as file:
+                return [json.loads(line) for line in file if line.strip()]
+        except OSError:
+            return []
+
+    def _add_entry(self, entry: dict) -> None:
+        self.entries.append(entry)
+        self.by_key[(entry["reference_time"], entry["location"])] = entry
+        self.by_location.setdefault(entry["location"], []).append(entry)
+
+    def _entries(self, location: Optional[str] = None) -> list[dict]:
+        if location is None:
+            return self.entries
+        return self.by_location.get(location, [])
+
+    # Model runs in the archive (for a location), oldest first
+    def reference_times(self, location: Optional[str] = None) -> list[str]:
+        return sorted({entry["reference_time"] for entry in self._entries(location)})
+
+    def locations(self) -> list[str]:
+        return list(self.by_location)
+
+    # Add the values of a location for a model run. The values of a run never
+    # change, a run already archived for the location is not added again.
+    def append(
+        self,
+        reference_time: str,
+        location: str,
+        time: list[datetime],
+        values: list[float],
+    ) -> bool:
+        if (reference_time, location) in self.by_key:
+            return False
+        records = numpy.empty(len(time), dtype=RECORD)
+        records["reference_time"] = _datetime64(reference_time)
+        records["time"] = numpy.asarray(time, dtype="datetime64[s]")
+        records["value"] = values
+
+        # The records are written before their index line, the bytes of an
+        # interrupted append are never referenced
+        with open(self.records_path, "ab") as file:
+            start = file.tell() // RECORD.itemsize
+            file.write(records.tobytes())
+        entry = {
+            "reference_time": reference_time,
+            "location": location,
+            "start": start,
+            "count": len(records),
+        }
+        with open(self.index_path, "a") as file:
+            file.write(json.dumps(entry) + "\n")
+        self._add_entry(entry)
+        return True
+
+    def _records(self) -> numpy.ndarray:
+        if not os.path.exists(self.records_path) or not os.path.getsize(self.records_path):
+            return numpy.empty(0, dtype=RECORD)
+        return numpy.memmap(self.records_path, dtype=RECORD, mode="r")
+
+    # Values of the archive as NumPy arrays ("location", "reference_time",
+    # "time" and "value"), restricted to the given location, model runs
+    # and validity times. Only the records of the selected runs and
+    # locations are read.
+    def query(
+        self,
+        location: Optional[str] = None,
+        reference_times: Optional[list[str]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+    ) -> dict[str, numpy.ndarray]:
+        entries = self._entries(location)
+        if reference_times is not None:
+            reference_times = set(reference_times)
+            entries = [
+                entry for entry in entries if entry["reference_time"] in reference_times
+            ]
+        records = self._records()
+        parts = [records[entry["start"]:entry["start"] + entry["count"]] for entry in entries]
+        names = [numpy.full(entry["count"], entry["location"], dtype=object) for entry in entries]
+        selected = numpy.concatenate(parts) if parts else numpy.empty(0, dtype=RECORD)
+        names = numpy.concatenate(names) if names else numpy.empty(0, dtype=object)
+
+        keep = numpy.ones(len(selected), dtype=bool)
+        if start is not None:
+            keep &= selected["time"] >= _datetime64(start)
+        if end is not None:
+            keep &= selected["time"] <= _datetime64(end)
+        selected = selected[keep]
+        return {
+            "location": names[keep],
+            "reference_time": selected["reference_time"],
+            "time": selected["time"],
+            "value": selected["value"],
+        }
+
+    # Values of a location as a (model runs, times) array over the union of
+    # the validity times of the runs (NaN where a run has no value), to
+    # compare successive runs
+    def runs(
+        self, location: str, reference_times: Optional[list[str]] = None
+    ) -> tuple[numpy.ndarray, numpy.ndarray, numpy.ndarray]:
+        result = self.query(location, reference_times)
+        runs, run_index = numpy.unique(result["reference_time"], return_inverse=True)
+        times, time_index = numpy.unique(result["time"], return_inverse=True)
+        values = numpy.full((len(runs), len(times)), numpy.nan, dtype=numpy.float32)
+        values[run_index, time_index] = result["value"]
+        return runs, times, values
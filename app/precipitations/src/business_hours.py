@@ -0,0 +1,44 @@
+# Importation of Python modules
+from datetime import datetime
+import os
+
+# Business hours of the stores, shared by the stages: fetch_data only
+# fetches the timesteps around them and prediction counts the sales
+# within them. They can be changed with environment variables.
+
+# Open hours (local time)
+OPENING = int(os.getenv("OPENING_HOUR", "9"))
+CLOSING = int(os.getenv("CLOSING_HOUR", "21"))
+
+# Local time zone (hours from UTC±00:00)
+TIME_ZONE = float(os.getenv("TIME_ZONE", "-7"))
+
+
+# Whether a timestep is within the open hours (the opening and closing
+# hours are excluded, as in prediction)
+def is_open(local_time: datetime, opening: float = OPENING, closing: float = CLOSING) -> bool:
+    hour = local_time.hour + local_time.minute / 60 + local_time.second / 3600
+    return opening < hour < closing
+
+
+# Timesteps that can change the anticipated profits: the open hours and,
+# on both sides of every opening period, the closed timestep next to it,
+# so that the values still cover each day from before the opening to
+# after the closing. The other timesteps are never sold on.
+def business_timesteps(
+    time: list[datetime],
+    local_time: list[datetime],
+    opening: float = OPENING,
+    closing: float = CLOSING,
+) -> tuple[list[datetime], list[datetime]]:
+    open_steps = [is_open(loc_time, opening, closing) for loc_time in local_time]
+    keep = [
+        open_steps[index]
+        or (index > 0 and open_steps[index - 1])
+        or (index + 1 < len(open_steps) and open_steps[index + 1])
+        for index in range(len(open_steps))
+    ]
+    return (
+        [timestep for timestep, kept in zip(time, keep) if kept],
+        [loc_time for loc_time, kept in zip(local_time, keep) if kept],
+    )
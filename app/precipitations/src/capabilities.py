@@ -0,0 +1,228 @@
+# Importation of Python modules
+from typing import IO, Optional
+import xml.etree.ElementTree as ET
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from geomet import GeoMetClient
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join("./", "cache"))
+CACHE_FILE = "capabilities.json"
+
+# Seconds during which a cached time dimension is used without asking GeoMet
+CAPABILITIES_TTL = 300
+
+# Description of the layers already read by this process, with the time
+# they were read (a long-running process revalidates them after the ttl
+# as well)
+_memory: dict[str, tuple[float, dict]] = {}
+
+# One lock per layer, so that the threads of the service needing the same
+# expired layer wait for a single GetCapabilities request, and one for the
+# cache file shared by the layers
+_locks: dict[str, threading.Lock] = {}
+_locks_lock = threading.Lock()
+_file_lock = threading.Lock()
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+# Native grid of a layer from a <BoundingBox> giving its resolution
+# (resx/resy), as {"bbox": [min_x, min_y, max_x, max_y],
+# "resolution": [x, y]} in longitude/latitude
+def _grid(element: ET.Element) -> Optional[dict]:
+    crs = element.get("CRS")
+    if crs not in ("CRS:84", "EPSG:4326") or element.get("resx") is None:
+        return None
+    values = [float(element.get(name)) for name in ("minx", "miny", "maxx", "maxy")]
+    resolution = [float(element.get("resx")), float(element.get("resy"))]
+    if crs == "EPSG:4326":
+        # Latitude/longitude axis order in WMS 1.3.0
+        values = [values[1], values[0], values[3], values[2]]
+        resolution.reverse()
+    return {"bbox": values, "resolution": resolution}
+
+
+# Streaming extraction of the dimensions and of the native grid (None
+# when the capabilities do not give it) of a single layer:
+# the document is never held in memory and the parsing stops as
+# soon as the layer has been read
+def parse_layer(source: IO[bytes], layer: str) -> Optional[dict]:
+    # One entry per open <Layer>, True when it is the requested layer
+    layers: list[bool] = []
+    dimensions: dict[str, str] = {}
+    grid = None
+    for event, element in ET.iterparse(source, events=("start", "end")):
+        tag = _local_name(element.tag)
+        if event == "start":
+            if tag == "Layer":
+                if layers and layers[-1]:
+                    # Sub-layers come after the description of their parent
+                    return {"dimensions": dimensions, "grid": grid}
+                layers.append(False)
+            continue
+
+        if tag == "Name" and layers and element.text == layer:
+            layers[-1] = True
+        elif tag == "Dimension" and layers and layers[-1]:
+            dimensions[element.get("name")] = element.text.strip()
+        elif tag == "BoundingBox" and layers and layers[-1] and grid is None:
+            grid = _grid(element)
+        elif tag == "Layer":
+            if layers.pop():
+                return {"dimensions": dimensions, "grid": grid}
+            element.clear()
+    return None
+
+
+def _load_cache(cache_dir: str) -> dict:
+    try:
+        with open(os.path.join(cache_dir, CACHE_FILE)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+# Write the entry of a layer in the cache file, keeping the entries of
+# the other layers. Each writer has its own temporary file, so that
+# concurrent processes never replace the file with a partial one.
+def _save_entry(cache_dir: str, layer: str, entry: dict) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, CACHE_FILE)
+    with _file_lock:
+        cache = _load_cache(cache_dir)
+        cache[layer] = entry
+        descriptor, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "w") as file:
+                json.dump(cache, file)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+
+def _layer_lock(layer: str) -> threading.Lock:
+    with _locks_lock:
+        return _locks.setdefault(layer, threading.Lock())
+
+
+# Dimensions and native grid of a layer, read from a GetCapabilities
+# document restricted to that layer. The values are kept on disk for
+# `ttl` seconds, then revalidated with the ETag/Last-Modified of the
+# last answer.
+def layer_description(
+    layer: str,
+    client: GeoMetClient,
+    cache_dir: str = CACHE_DIR,
+    ttl: float = CAPABILITIES_TTL,
+) -> dict:
+    if layer in _memory and time.time() - _memory[layer][0] < ttl:
+        metrics.observe_cache("capabilities", 1, 0)
+        return _memory[layer][1]
+
+    requested_at = time.time()
+    with _layer_lock(layer):
+        # Read by another thread while this one was waiting
+        if layer in _memory and _memory[layer][0] >= requested_at:
+            metrics.observe_cache("capabilities", 1, 0)
+            return _memory[layer][1]
+        return _read_description(layer, client, cache_dir, ttl)
+
+
+def _read_description(layer: str, client: GeoMetClient, cache_dir: str, ttl: float) -> dict:
+    entry = _load_cache(cache_dir).get(layer)
+    if entry is not None and "description" not in entry:
+        # Written by a previous version of the cache
+        entry = None
+    if entry is not None and time.time() - entry["fetched_at"] < ttl:
+        logger.info(f"Dimensions of {layer} read from the cache")
+        metrics.observe_cache("capabilities", 1, 0)
+        _memory[layer] = (entry["fetched_at"], entry["description"])
+        return entry["description"]
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    logger.info(f"Requesting the capabilities of {layer}")
+    params = {
+        "SERVICE": "WMS",
+        "VERSION": "1.3.0",
+        "REQUEST": "GetCapabilities",
+        # GeoMet extension returning only the requested layer
+        "LAYER": layer,
+    }
+    start = time.monotonic()
+    with client.session.get(
+        client.url, params=params, headers=headers, timeout=client.timeout, stream=True
+    ) as response:
+        if response.status_code == 304 and entry is not None:
+            logger.info(f"Capabilities of {layer} not modified")
+            metrics.observe_cache("capabilities", 1, 0)
+            description = entry["description"]
+        else:
+            metrics.observe_cache("capabilities", 0, 1)
+            response.raise_for_status()
+            response.raw.decode_content = True
+            description = parse_layer(response.raw, layer)
+            if not description or "time" not in description["dimensions"]:
+                raise ValueError(f"No time dimension found for layer {layer}")
+        previous = entry or {}
+        entry = {
+            "description": description,
+            "etag": response.headers.get("ETag", previous.get("etag")),
+            "last_modified": response.headers.get(
+                "Last-Modified", previous.get("last_modified")
+            ),
+            "fetched_at": time.time(),
+        }
+        # Bytes read until the layer was parsed
+        metrics.observe_request(
+            "GetCapabilities", time.monotonic() - start, response.raw.tell()
+        )
+
+    _save_entry(cache_dir, layer, entry)
+    _memory[layer] = (entry["fetched_at"], description)
+    return description
+
+
+# Dimensions ("time", "reference_time", ...) of a layer
+def layer_dimensions(layer: str, client: GeoMetClient) -> dict[str, str]:
+    return layer_description(layer, client)["dimensions"]
+
+
+# Native grid of a layer (None when the capabilities do not give
+# its resolution)
+def layer_grid(layer: str, client: GeoMetClient) -> Optional[dict]:
+    return layer_description(layer, client)["grid"]
+
+
+# Time dimension ("start/end/interval") of a layer
+def layer_time_dimension(layer: str, client: GeoMetClient) -> str:
+    return layer_dimensions(layer, client)["time"]
+
+
+# Reference time of the latest model run published for a layer
+# (None when the layer has no reference_time dimension)
+def layer_reference_time(layer: str, client: GeoMetClient) -> Optional[str]:
+    reference_time = layer_dimensions(layer, client).get("reference_time")
+    if reference_time is None:
+        return None
+    # Either a list of runs or a "start/end/interval" range
+    latest = reference_time.split(",")[-1]
+    if "/" in latest:
+        latest = latest.split("/")[1]
+    return latest
@@ -0,0 +1,210 @@
+# Importation of Python modules
+from datetime import datetime
+from typing import IO, Optional
+import json
+import os
+import zipfile
+
+# The following modules must first be installed to use
+# this code out of Jupyter Notebook
+import click
+
+from locations import shard
+
+# Entries of a batch mode values.json holding one item per location
+LOCATION_KEYS = ("locations", "pixel_value", "cumulative_profit")
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Name of the file written for the next stage in each format
+VALUES_FILES = {"json": "values.json", "npz": "values.npz"}
+
+# Binary interchange (values.npz): the timesteps are datetime64[s] arrays
+# (seconds since the epoch), the values float64 arrays (so that both
+# formats give the same values downstream) and the other entries are
+# kept as JSON
+TIME_KEYS = ("local_time", "open_hours", "time")
+ARRAY_KEYS = ("pixel_value", "cumulative_profit", "exceedance", "expected_profit")
+# Entries holding one array per layer
+LAYER_KEYS = ("values",)
+METADATA = "metadata"
+
+
+# Options shared by the stages reading the values.json of the previous stage
+def input_options(function):
+    function = click.option(
+        "--input_path",
+        "input_file",
+        type=click.File("r", encoding="utf-8"),
+        help="values.json of the previous stage ('-' to read stdin)",
+    )(function)
+    function = click.option(
+        "--input_data",
+        type=str,
+        help="Content of values.json of the previous stage",
+    )(function)
+    return function
+
+
+# Option of the stages writing values for the next stage
+def output_options(function):
+    return click.option(
+        "--output_format",
+        type=click.Choice(list(VALUES_FILES)),
+        default="json",
+        show_default=True,
+        help="Format of the values written for the next stage "
+        "(npz: binary, loaded without parsing)",
+    )(function)
+
+
+# Dataset given to a stage either as a JSON string on the command line
+# or as a file written by the previous stage
+def load_input(input_data: Optional[str], input_file: Optional[IO[str]]) -> dict:
+    if (input_data is None) == (input_file is None):
+        raise click.UsageError("Exactly one of --input_data and --input_path is required")
+    if input_file is not None:
+        if input_file.name.endswith(".npz"):
+            input_file.close()
+            return load_values(input_file.name)
+        return json.load(input_file)
+    return json.loads(input_data)
+
+
+# Timesteps of a dataset as datetime objects, from the strings of
+# values.json or from the datetime64 array of values.npz
+def parse_times(values) -> list[datetime]:
+    if hasattr(values, "dtype"):
+        return values.astype("datetime64[s]").astype(object).tolist()
+    return [datetime.strptime(value, TIME_FORMAT) for value in values]
+
+
+# Write a dataset as values.json or, when the path ends with .npz, in the
+# binary interchange format
+def save_values(data: dict, path: str) -> None:
+    if path.endswith(".npz"):
+        return _save_npz(data, path)
+    # json.dumps uses the C encoder, json.dump does not
+    with open(path, "w") as file:
+        file.write(json.dumps(data, default=_to_json))
+
+
+def _to_json(value):
+    import numpy
+
+    if isinstance(value, numpy.ndarray):
+        if value.dtype.kind == "M":
+            return [
+                time.replace("T", " ")
+                for time in numpy.datetime_as_string(value, unit="s").tolist()
+            ]
+        return value.tolist()
+    if isinstance(value, numpy.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _save_npz(data: dict, path: str) -> None:
+    import numpy
+
+    arrays = {}
+    metadata = {}
+    for key, value in data.items():
+        if key in TIME_KEYS:
+            arrays[key] = numpy.asarray(value, dtype="datetime64[s]")
+        elif key in ARRAY_KEYS:
+            arrays[key] = numpy.asarray(value, dtype=numpy.float64)
+        elif key in LAYER_KEYS:
+            for layer, values in value.items():
+                arrays[f"{key}/{layer}"] = numpy.asarray(values, dtype=numpy.float64)
+        else:
+            metadata[key] = value
+    arrays[METADATA] = numpy.frombuffer(
+        json.dumps(metadata, default=_to_json).encode(), dtype=numpy.uint8
+    )
+    # Not compressed, so that the arrays can be memory-mapped
+    with open(path + ".tmp", "wb") as file:
+        numpy.savez(file, **arrays)
+    os.replace(path + ".tmp", path)
+
+
+# Array of a member of a .npz file, memory-mapped when it is stored
+# without compression (as written by save_values)
+def _npz_array(path: str, file: IO[bytes], info: zipfile.ZipInfo):
+    import numpy
+
+    # The local header of the member is followed by its name and
+    # an extra field of variable length
+    file.seek(info.header_offset + 26)
+    name_length, extra_length = numpy.frombuffer(file.read(4), dtype="<u2")
+    file.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    if numpy.lib.format.read_magic(file) != (1, 0):
+        return None
+    shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(file)
+    if dtype.hasobject:
+        return None
+    if 0 in shape or not shape:
+        return numpy.zeros(shape, dtype=dtype)
+    return numpy.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        shape=shape,
+        order="F" if fortran_order else "C",
+        offset=file.tell(),
+    )
+
+
+# Read a values.npz: the arrays are memory-mapped from the file,
+# without copy nor parsing
+def load_values(path: str) -> dict:
+    import numpy
+
+    data = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as file:
+        for info in archive.infolist():
+            key = info.filename.removesuffix(".npy")
+            array = _npz_array(path, file, info)
+            if array is None:
+                # Compressed or written by another tool
+                array = numpy.load(path)[key]
+            if key == METADATA:
+                data.update(json.loads(bytes(array)))
+            elif "/" in key:
+                group, layer = key.split("/", 1)
+                data.setdefault(group, {})[layer] = array
+            else:
+                data[key] = array
+    return data
+
+
+# Options of the stages processing a single shard of the locations
+# of the batch mode
+def shard_options(function):
+    function = click.option(
+        "--shard_count",
+        type=click.IntRange(min=1),
+        default=1,
+        show_default=True,
+        help="Number of shards the locations are split into",
+    )(function)
+    function = click.option(
+        "--shard_index",
+        type=click.IntRange(min=0),
+        default=0,
+        show_default=True,
+        help="Shard of the locations processed (from 0 to shard_count - 1)",
+    )(function)
+    return function
+
+
+# Dataset of the batch mode restricted to the locations of one shard
+def shard_values(data: dict, shard_index: int, shard_count: int) -> dict:
+    data = dict(data)
+    for key in LOCATION_KEYS:
+        if key in data:
+            data[key] = shard(data[key], shard_index, shard_count)
+    data["shard"] = {"index": shard_index, "count": shard_count}
+    return data
@@ -0,0 +1,75 @@
+# Importation of Python modules
+import json
+import math
+import re
+
+# Value returned for a layer without data at the queried pixel
+NODATA = math.nan
+
+TEXT = "text/plain"
+JSON = "application/json"
+
+_VALUE = re.compile(r"value_0\s*=\s*'([^']*)'")
+_LAYER = re.compile(r"^Layer '([^']*)'", flags=re.MULTILINE)
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # Empty values and "nodata" markers
+        return NODATA
+
+
+# Probability extraction from a text/plain answer
+def value_from_text(text: str) -> float:
+    match = _VALUE.search(text)
+    if match is None:
+        # No feature at the queried pixel
+        return NODATA
+    return _to_float(match.group(1))
+
+
+# Values of every queried layer from a text/plain answer
+# (one "Layer '<name>'" section per layer)
+def values_from_text(text: str, layers: list[str]) -> dict[str, float]:
+    if len(layers) == 1:
+        return {layers[0]: value_from_text(text)}
+    sections = _LAYER.split(text)
+    values = {
+        name: value_from_text(section)
+        for name, section in zip(sections[1::2], sections[2::2])
+    }
+    return {layer: values.get(layer, NODATA) for layer in layers}
+
+
+def _feature_value(feature: dict) -> float:
+    properties = feature.get("properties") or {}
+    return _to_float(properties.get("value_0", properties.get("value")))
+
+
+def _feature_layer(feature: dict):
+    properties = feature.get("properties") or {}
+    return properties.get("layer", feature.get("layer"))
+
+
+# Values of every queried layer from a GeoJSON answer. The features are
+# matched to the layers by their layer name when there is one, otherwise
+# in the order of the query.
+def values_from_json(content: bytes, layers: list[str]) -> dict[str, float]:
+    features = json.loads(content).get("features") or []
+    if len(layers) == 1:
+        return {layers[0]: _feature_value(features[0]) if features else NODATA}
+    named = {_feature_layer(feature): feature for feature in features}
+    if all(layer in named for layer in layers):
+        return {layer: _feature_value(named[layer]) for layer in layers}
+    values = [_feature_value(feature) for feature in features]
+    values += [NODATA] * (len(layers) - len(values))
+    return dict(zip(layers, values))
+
+
+# Values of every queried layer from a GetFeatureInfo answer
+def parse(content: bytes, info_format: str, layers: list[str]) -> dict[str, float]:
+    if info_format == JSON:
+        return values_from_json(content, layers)
+    return values_from_text(content.decode("utf-8"), layers)
@@ -2,44 +2,83 @@
 from dataclasses import dataclass
 import json
 from datetime import datetime, timedelta
+from typing import IO, Iterator, Optional
 import re
-from typing import Union
-import warnings
 import logging
 import os
 
 # The following modules must first be installed to use
 # this code out of Jupyter Notebook
-import matplotlib.pyplot as plt
-from owslib.wms import WebMapService
-from owslib.map.wms130 import WebMapService_1_3_0
-from owslib.map.wms111 import WebMapService_1_1_1
 import click
+from click.core import ParameterSource
+
+from business_hours import CLOSING, OPENING, TIME_ZONE, business_timesteps
+from capabilities import layer_reference_time, layer_time_dimension
+from dataio import (
+    VALUES_FILES,
+    load_values,
+    output_options,
+    parse_times,
+    save_values,
+    shard_options,
+)
+import featureinfo
+from geomet import GeoMetClient
+import metrics
+from utils import save_fig, save_figs
+from value_cache import ValueCache
 
-from utils import fig
-
-# Ignore warnings from the OWSLib module
-warnings.filterwarnings("ignore", module="owslib", category=UserWarning)
-
-# add and configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-WMS = Union[WebMapService_1_3_0, WebMapService_1_1_1]
-
 OUTPUT_DIR = os.path.join("./", "plots")
 TEMP_OUTPUT_DIR = os.path.join("./", "data")
 
-logger.info("Creating output directory")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(TEMP_OUTPUT_DIR, exist_ok=True)
+# Cube of the gridded mode, saved next to values.json
+GRID_FILE = "grid.npy"
+
+# Layer of the probability of getting 5 mm or more of precipitations
+LAYER = "REPS.DIAG.3_PRMM.ERGE5"
+
+
+# Layer of the probability of getting `threshold` mm or more of precipitations
+def exceedance_layer(threshold: float) -> str:
+    return f"REPS.DIAG.3_PRMM.ERGE{float(threshold):g}"
+
+
+# Exceedance layers of the comma separated thresholds, from the smallest.
+# They must be published by GeoMet with the time dimension of the layer,
+# so that they can be queried together with it.
+def threshold_layers(
+    thresholds: str, client: GeoMetClient, time_dimension: tuple[datetime, datetime, int]
+) -> dict[float, str]:
+    try:
+        values = sorted({float(threshold) for threshold in thresholds.split(",")})
+    except ValueError:
+        raise click.BadParameter(
+            f"{thresholds} is not a list of numbers", param_hint="--thresholds"
+        )
+    layers = {}
+    for threshold in values:
+        name = exceedance_layer(threshold)
+        try:
+            dimension = time_parameters(name, client)
+        except ValueError:
+            raise click.BadParameter(
+                f"No layer {name} is published for {threshold:g} mm",
+                param_hint="--thresholds",
+            )
+        if dimension != time_dimension:
+            raise click.BadParameter(
+                f"{name} does not have the timesteps of the layer",
+                param_hint="--thresholds",
+            )
+        layers[threshold] = name
+    return layers
 
 
 # Extraction of temporal information from metadata
-def time_parameters(layer: str, wms: WMS) -> tuple[datetime, datetime, int]:
-    start_time, end_time, interval = (
-        wms[layer].dimensions["time"]["values"][0].split("/")
-    )
+def time_parameters(layer: str, client: GeoMetClient) -> tuple[datetime, datetime, int]:
+    start_time, end_time, interval = layer_time_dimension(layer, client).split("/")
     iso_format = "%Y-%m-%dT%H:%M:%SZ"
     start_time = datetime.strptime(start_time, iso_format)
     end_time = datetime.strptime(end_time, iso_format)
@@ -47,6 +86,18 @@ def time_parameters(layer: str, wms: WMS) -> tuple[datetime, datetime, int]:
     return start_time, end_time, interval
 
 
+# Timesteps of the predictions (at UTC±00:00) and their local time
+def forecast_times(
+    start_time: datetime, end_time: datetime, interval: int, time_zone: float = TIME_ZONE
+) -> tuple[list[datetime], list[datetime]]:
+    time = [start_time]
+    local_time = [start_time + timedelta(hours=time_zone)]
+    while time[-1] < end_time:
+        time.append(time[-1] + timedelta(hours=interval))
+        local_time.append(time[-1] + timedelta(hours=time_zone))
+    return time, local_time
+
+
 # To use specific starting and ending time, remove the #
 # from the next lines and replace the start_time and
 # end_time with the desired values:
@@ -59,154 +110,874 @@ def time_parameters(layer: str, wms: WMS) -> tuple[datetime, datetime, int]:
 
 @dataclass
 class RequestInput:
-    layer: str
+    layers: list[str]
     time: list[datetime]
     min_x: float
     min_y: float
     max_x: float
     max_y: float
-    wms: WMS
-
-# Loop to carry out the requests and extract the probabilities
-def request(input: RequestInput):
-    info = []
-    pixel_value = []
-    for timestep in input.time:
-        # WMS GetFeatureInfo query
-        info.append(
-            input.wms.getfeatureinfo(
-                layers=[input.layer],
-                srs="EPSG:4326",
-                bbox=(input.min_x, input.min_y, input.max_x, input.max_y),
-                size=(100, 100),
-                format="image/jpeg",
-                query_layers=[input.layer],
-                info_format="text/plain",
-                xy=(50, 50),
-                feature_count=1,
-                time=str(timestep.isoformat()) + "Z",
+    client: GeoMetClient
+    # Model run of the layers, required to use the cache
+    reference_time: Optional[str] = None
+    cache: Optional[ValueCache] = None
+    info_format: str = featureinfo.TEXT
+
+
+# Concurrent requests to extract the values of all the layers, with one
+# GetFeatureInfo query per timestep whatever the number of layers
+# (the values are returned in the order of the timesteps)
+def request(input: RequestInput) -> dict[str, list[float]]:
+    results = {layer: [] for layer in dict.fromkeys(input.layers)}
+    for values in request_stream(input):
+        for layer, value in values.items():
+            results[layer].append(value)
+    return results
+
+
+# Values of the layers at every timestep, yielded in order as soon as the
+# timestep is read from the cache or fetched
+def request_stream(input: RequestInput) -> Iterator[dict[str, float]]:
+    layers = list(dict.fromkeys(input.layers))
+    bbox = (input.min_x, input.min_y, input.max_x, input.max_y)
+
+    # Values already fetched for the same model run and location
+    use_cache = input.cache is not None and input.reference_time is not None
+    location = f"{input.min_x},{input.min_y},{input.max_x},{input.max_y};50,50"
+    cached = {layer: [None] * len(input.time) for layer in layers}
+    if use_cache:
+        for layer in layers:
+            input.cache.invalidate(layer, input.reference_time)
+            cached[layer] = input.cache.get(
+                layer, input.reference_time, input.time, location
             )
+    missing = [
+        index
+        for index in range(len(input.time))
+        if any(cached[layer][index] is None for layer in layers)
+    ]
+    if use_cache:
+        logger.info(f"{len(input.time) - len(missing)} timesteps read from the cache")
+
+    def fetch(timestep: datetime) -> dict[str, float]:
+        # WMS GetFeatureInfo query
+        content = input.client.getfeatureinfo(
+            layers=layers,
+            bbox=bbox,
+            time=timestep,
+            feature_count=len(layers),
+            reference_time=input.reference_time,
+            info_format=input.info_format,
         )
-        # Probability extraction from the request's results
-        text = info[-1].read().decode("utf-8")
-        pixel_value.append(str(re.findall(r"value_0\s+\d*.*\d+", text)))
-        pixel_value[-1] = float(
-            re.sub("value_0 = '", "", pixel_value[-1]).strip('[""]')
+        return featureinfo.parse(content, input.info_format, layers)
+
+    # The missing timesteps are fetched in order, in the background of
+    # the timesteps already known
+    fetched = input.client.imap(fetch, [input.time[index] for index in missing])
+    missing_indices = set(missing)
+    new_times = []
+    new_values = {layer: [] for layer in layers}
+    try:
+        for index in range(len(input.time)):
+            if index in missing_indices:
+                values = next(fetched)
+                new_times.append(input.time[index])
+                for layer in layers:
+                    new_values[layer].append(values[layer])
+            else:
+                values = {layer: cached[layer][index] for layer in layers}
+            yield values
+    finally:
+        # The timesteps fetched are cached even if the reader stops early
+        if use_cache and new_times:
+            for layer in layers:
+                input.cache.put(
+                    layer, input.reference_time, new_times, location, new_values[layer]
+                )
+
+
+# Values of the layers saved in the values.json (or values.npz) of a
+# previous run for the same bbox and model run, as one {timestep: value}
+# mapping per layer (the values of another model run are never reused)
+def previous_values(
+    path: str, layers: list[str], bbox: list[float], reference_time: Optional[str]
+) -> dict[str, dict[datetime, float]]:
+    try:
+        if path.endswith(".npz"):
+            previous = load_values(path)
+        else:
+            with open(path) as file:
+                previous = json.load(file)
+    except (OSError, ValueError):
+        logger.info(f"No previous values found in {path}")
+        return {}
+    if previous.get("bbox") != bbox or "values" not in previous:
+        logger.info(f"Previous values in {path} are not for the same request")
+        return {}
+    if reference_time is None or previous.get("reference_time") != reference_time:
+        logger.info(
+            f"Previous values in {path} are from the model run "
+            f"{previous.get('reference_time')}, not {reference_time}"
         )
-
-    return pixel_value
+        return {}
+    time = parse_times(previous["time"])
+    return {
+        layer: dict(zip(time, map(float, previous["values"][layer])))
+        for layer in layers
+        if layer in previous["values"]
+    }
+
+
+# Arguments of the fig function for the plot of the probabilities
+def probability_plot(
+    local_time: list[datetime],
+    pixel_value: list[float],
+    y2: Optional[list[float]] = None,
+    y2label: Optional[str] = None,
+) -> dict:
+    return dict(
+        x=local_time,
+        y=pixel_value,
+        title=(
+            "Probability of getting 5 mm or more of precipitations between"
+            + f"\n{local_time[0]} and {local_time[-1]} (local time)"
+        ),
+        xlabel="\nDate and time",
+        ylabel="Probability of getting 5 mm\nor more of precipitations (%)",
+        ylim=(-10, 110),
+        y2=y2,
+        y2label=y2label,
+    )
 
 
 @click.command()
 @click.option("--pos_x", type=str, help="X coordinate") 
 @click.option("--pos_y", type=str, help="Y coordinate")
-def main(pos_x: str, pos_y: str) -> None:
+@click.option(
+    "--locations",
+    "locations_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="CSV file of locations (columns x, y and name) fetched in batch mode",
+)
+@shard_options
+@click.option(
+    "--amount_layer",
+    type=str,
+    default="REPS.DIAG.3_PRMM.ERGE5",
+    show_default=True,
+    help="Layer plotted as the quantity of precipitations",
+)
+@click.option(
+    "--thresholds",
+    type=str,
+    help="Comma separated precipitation thresholds (mm, e.g. 1,5,10,25) whose "
+    "exceedance layers are fetched with the same queries",
+)
+@click.option(
+    "--previous",
+    "previous_path",
+    type=click.Path(dir_okay=False),
+    help="values.json of a previous run, only the timesteps it lacks are fetched",
+)
+@click.option(
+    "--no_cache",
+    is_flag=True,
+    help="Always request the values from GeoMet",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Number of concurrent WMS requests",
+)
+@click.option(
+    "--timeout",
+    type=float,
+    default=30,
+    show_default=True,
+    help="Deadline in seconds of each WMS request, answer included",
+)
+@click.option(
+    "--retries",
+    type=int,
+    default=3,
+    show_default=True,
+    help="Number of retries of a failed WMS request",
+)
+@click.option(
+    "--hedge_percentile",
+    type=click.FloatRange(0, 100),
+    help="Send a duplicate of the requests slower than this latency percentile",
+)
+@click.option(
+    "--rate_limit",
+    type=float,
+    help="Maximum number of WMS requests per second",
+)
+@click.option(
+    "--info_format",
+    type=click.Choice([featureinfo.TEXT, featureinfo.JSON]),
+    default=featureinfo.TEXT,
+    show_default=True,
+    help="Format of the GetFeatureInfo answers",
+)
+@click.option(
+    "--archive",
+    "archive_dir",
+    type=click.Path(file_okay=False),
+    help="Directory of the archive of the fetched values, kept across runs",
+)
+@click.option(
+    "--all_hours",
+    is_flag=True,
+    help="Fetch every timestep, not only the ones around the business hours",
+)
+@click.option(
+    "--grid",
+    is_flag=True,
+    help="Fetch the full raster of the bbox at every timestep (saved in data/grid.npy)",
+)
+@click.option(
+    "--bbox",
+    type=str,
+    help="Bbox (min_x,min_y,max_x,max_y) of the gridded mode, "
+    "0.5° around the coordinates by default",
+)
+@output_options
+@click.option(
+    "--stream",
+    "stream_file",
+    type=click.File("w", encoding="utf-8", lazy=False),
+    help="Write the values to this NDJSON stream ('-' for stdout) as they are "
+    "fetched, instead of values.json",
+)
+@click.option("--no_plot", is_flag=True, help="Only save the values, without plots")
+@click.option(
+    "--plot_processes",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of processes rendering the plots of the batch mode",
+)
+def main(
+    pos_x: str,
+    pos_y: str,
+    locations_path: str,
+    shard_index: int,
+    shard_count: int,
+    amount_layer: str,
+    thresholds: Optional[str],
+    previous_path: str,
+    no_cache: bool,
+    workers: int,
+    timeout: float,
+    retries: int,
+    hedge_percentile: Optional[float],
+    rate_limit: Optional[float],
+    info_format: str,
+    archive_dir: Optional[str],
+    all_hours: bool,
+    grid: bool,
+    bbox: Optional[str],
+    output_format: str,
+    stream_file: Optional[IO[str]],
+    no_plot: bool,
+    plot_processes: int,
+) -> None:
+    # add and configure logging
+    logging.basicConfig(level=logging.INFO)
+
+    if stream_file is not None:
+        # Options of the other modes, that the stream cannot honour
+        context = click.get_current_context()
+        explicit = {
+            name
+            for name in ("amount_layer", "output_format")
+            if context.get_parameter_source(name) is not ParameterSource.DEFAULT
+        }
+        unsupported = [
+            option
+            for option, given in (
+                ("--thresholds", thresholds is not None),
+                ("--previous", previous_path is not None),
+                ("--archive", archive_dir is not None),
+                ("--grid", grid),
+                ("--amount_layer", "amount_layer" in explicit),
+                ("--output_format", "output_format" in explicit),
+            )
+            if given
+        ]
+        if unsupported:
+            raise click.UsageError(f"--stream cannot be used with {', '.join(unsupported)}")
+        records = stream(
+            pos_x=pos_x,
+            pos_y=pos_y,
+            locations_path=locations_path,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            no_cache=no_cache,
+            workers=workers,
+            timeout=timeout,
+            retries=retries,
+            hedge_percentile=hedge_percentile,
+            rate_limit=rate_limit,
+            info_format=info_format,
+            all_hours=all_hours,
+        )
+        # The records are fetched while they are written
+        with metrics.stage("fetch_data"):
+            write_stream(records, stream_file)
+        metrics.write()
+        return
+
+    values = fetch(
+        pos_x=pos_x,
+        pos_y=pos_y,
+        locations_path=locations_path,
+        shard_index=shard_index,
+        shard_count=shard_count,
+        amount_layer=amount_layer,
+        thresholds=thresholds,
+        previous_path=previous_path,
+        no_cache=no_cache,
+        workers=workers,
+        timeout=timeout,
+        retries=retries,
+        hedge_percentile=hedge_percentile,
+        rate_limit=rate_limit,
+        info_format=info_format,
+        archive_dir=archive_dir,
+        all_hours=all_hours,
+        grid=grid,
+        bbox=bbox,
+        plot=not no_plot,
+        plot_processes=plot_processes,
+    )
+    save_values(values, os.path.join(TEMP_OUTPUT_DIR, VALUES_FILES[output_format]))
+    logger.info("Values saved")
+    metrics.write()
+
+
+# Fetch the probabilities, save the plot and return the
+# content of values.json
+@metrics.stage("fetch_data")
+def fetch(
+    pos_x: Optional[str] = None,
+    pos_y: Optional[str] = None,
+    locations_path: Optional[str] = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    amount_layer: str = "REPS.DIAG.3_PRMM.ERGE5",
+    thresholds: Optional[str] = None,
+    previous_path: Optional[str] = None,
+    no_cache: bool = False,
+    workers: int = 8,
+    timeout: float = 30,
+    retries: int = 3,
+    hedge_percentile: Optional[float] = None,
+    rate_limit: Optional[float] = None,
+    info_format: str = featureinfo.TEXT,
+    archive_dir: Optional[str] = None,
+    all_hours: bool = False,
+    grid: bool = False,
+    bbox: Optional[str] = None,
+    plot: bool = True,
+    plot_processes: int = 1,
+) -> dict:
+    logger.info("Creating output directory")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(TEMP_OUTPUT_DIR, exist_ok=True)
+
     # Parameters choice
     # Layer:
-    layer = "REPS.DIAG.3_PRMM.ERGE5"
+    layer = LAYER
     logger.info(f"Layer: {layer}")
 
-    # Coordinates: (from input)
-    x = float(pos_x)  # -123.116
-    y = float(pos_y)  # 49.288
-
-    logger.info(f"Coordinates: {x}, {y}")
-
-    # Local time zone (in this exemple, the local time zone is UTC-07:00):
-    time_zone = -7
+    # Local time zone:
+    time_zone = TIME_ZONE
     logger.info(f"Local time zone: {time_zone}")
 
-    # bbox parameter
-    min_x, min_y, max_x, max_y = x - 0.25, y - 0.25, x + 0.25, y + 0.25
-
-    logger.info(f"bbox: {min_x}, {min_y}, {max_x}, {max_y}")
-
     # WMS service connection
     logger.info("Connecting to the WMS service")
-    wms = WebMapService(
-        "https://geo.weather.gc.ca/geomet?SERVICE=WMS" + "&REQUEST=GetCapabilities",
-        version="1.3.0",
-        timeout=300,
+    client = GeoMetClient(
+        workers=workers,
+        timeout=timeout,
+        retries=retries,
+        hedge_percentile=hedge_percentile,
+        rate_limit=rate_limit,
     )
 
-    start_time, end_time, interval = time_parameters(layer, wms)
+    start_time, end_time, interval = time_parameters(layer, client)
     logger.info(f"Start time: {start_time}, End time: {end_time}, Interval: {interval}")
 
     # Calculation of date and time for available predictions
     logger.info("Calculating the date and time for available predictions")
 
     # (the time variable represents time at UTC±00:00)
-    time = [start_time]
-    local_time = [start_time + timedelta(hours=time_zone)]
-    while time[-1] < end_time:
-        time.append(time[-1] + timedelta(hours=interval))
-        local_time.append(time[-1] + timedelta(hours=time_zone))
+    time, local_time = forecast_times(start_time, end_time, interval, time_zone)
+    # Open hours around which the timesteps are fetched (none: every timestep),
+    # written in values.json so that prediction knows the hours it can model
+    business_hours = None
+    if not all_hours:
+        count = len(time)
+        time, local_time = business_timesteps(time, local_time)
+        logger.info(f"{len(time)} of {count} timesteps around the business hours fetched")
+        business_hours = {"opening": OPENING, "closing": CLOSING}
+
+    if locations_path is not None:
+        values = batch(
+            locations_path,
+            layer,
+            time,
+            local_time,
+            interval,
+            client,
+            start_time=start_time,
+            end_time=end_time,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            archive_dir=archive_dir,
+            plot=plot,
+            plot_processes=plot_processes,
+        )
+        client.close()
+        return {**values, "business_hours": business_hours}
+
+    if grid:
+        if bbox is not None:
+            grid_bbox = tuple(float(value) for value in bbox.split(","))
+        else:
+            x, y = float(pos_x), float(pos_y)
+            grid_bbox = (x - 0.25, y - 0.25, x + 0.25, y + 0.25)
+        values = gridded(
+            grid_bbox,
+            layer,
+            time,
+            local_time,
+            interval,
+            client,
+            start_time=start_time,
+            end_time=end_time,
+            plot=plot,
+        )
+        client.close()
+        return {**values, "business_hours": business_hours}
+
+    # Coordinates: (from input)
+    x = float(pos_x)  # -123.116
+    y = float(pos_y)  # 49.288
+
+    logger.info(f"Coordinates: {x}, {y}")
 
+    # bbox parameter
+    min_x, min_y, max_x, max_y = x - 0.25, y - 0.25, x + 0.25, y + 0.25
+
+    logger.info(f"bbox: {min_x}, {min_y}, {max_x}, {max_y}")
+
+    # Add quantity of precipitations to the plot
+    logger.info("Adding quantity of precipitations to the plot")
+    # Verification of temporal parameters compatibility:
+    layers = [layer]
+    if amount_layer != layer:
+        start_time1, end_time1, interval1 = time_parameters(amount_layer, client)
+        if start_time1 == start_time and end_time1 == end_time and interval1 == interval:
+            layers.append(amount_layer)
+        else:
+            logger.info(f"Time parameters of {amount_layer} do not match, not plotted")
+
+    # Exceedance layers of every threshold, from the smallest threshold.
+    # They share the time dimension of the layer and are queried together
+    # with it, one GetFeatureInfo query per timestep whatever their number.
+    exceedance_layers = {}
+    if thresholds is not None:
+        exceedance_layers = threshold_layers(
+            thresholds, client, (start_time, end_time, interval)
+        )
+        layers += [name for name in exceedance_layers.values() if name not in layers]
+        logger.info(f"Exceedance layers: {list(exceedance_layers.values())}")
+
+    # Model run of the values
+    reference_time = layer_reference_time(layer, client)
+    logger.info(f"Model run: {reference_time}")
+
+    # Timesteps already fetched by the previous run are not requested again
+    previous = {}
+    if previous_path is not None:
+        previous = previous_values(
+            previous_path, layers, [min_x, min_y, max_x, max_y], reference_time
+        )
+    new_time = [
+        timestep
+        for timestep in time
+        if any(timestep not in previous.get(layer, {}) for layer in layers)
+    ]
+    logger.info(f"{len(time) - len(new_time)} timesteps reused from the previous run")
+
+    # GetFeatureInfo requests for all the layers in a single pass
+    logger.info("GetFeatureInfo request")
     request_input = RequestInput(
-        layer=layer,
-        time=time,
+        layers=layers,
+        time=new_time,
         min_x=min_x,
         min_y=min_y,
         max_x=max_x,
         max_y=max_y,
-        wms=wms,
+        client=client,
+        reference_time=reference_time,
+        cache=None if no_cache else ValueCache(),
+        info_format=info_format,
     )
-    pixel_value = request(request_input)
+    fetched = request(request_input)
+    values = {}
+    for name in layers:
+        known = previous.get(name, {})
+        known.update(zip(new_time, fetched[name]))
+        values[name] = [known[timestep] for timestep in time]
+    pixel_value = values[layer]
     logger.info(f"Pixel value: {pixel_value}")
 
-    # Add quantity of precipitations to the plot
-    logger.info("Adding quantity of precipitations to the plot")
-    # Verification of temporal parameters compatibility:
-    start_time1, end_time1, interval1 = time_parameters(layer, wms)
+    if archive_dir is not None:
+        for name in layers:
+            archive_values(
+                archive_dir,
+                name,
+                request_input.reference_time,
+                [f"{x},{y}"],
+                time,
+                [values[name]],
+            )
 
     y2 = None
     y2label = None
-    if start_time1 == start_time and end_time1 == end_time and interval1 == interval:
-        # GetFeatureInfo request
-        logger.info("GetFeatureInfo request")
-        y2 = request(request_input)
+    if amount_layer in values:
+        y2 = values[amount_layer]
         y2label = "Quantity of precipitations (mm)"
+    client.close()
+    if request_input.cache is not None:
+        request_input.cache.close()
+
+    exceedance = {}
+    if exceedance_layers:
+        # Probabilities of exceedance as a threshold x time array
+        exceedance = {
+            "thresholds": list(exceedance_layers),
+            "exceedance": [values[name] for name in exceedance_layers.values()],
+        }
+
+    if plot:
+        # Create the plot with the fig function and save the plot
+        logger.info("Creating the plot")
+        logger.info(f"x: {local_time}")
+        logger.info(f"y: {pixel_value}")
+        logger.info(f"y2: {y2}")
+        logger.info(f"y2label: {y2label}")
+        save_fig(
+            os.path.join(OUTPUT_DIR, "probability_of_rain.png"),
+            **probability_plot(local_time, pixel_value, y2, y2label),
+        )
+        logger.info("Plot saved")
+
+    return {
+        "local_time": [
+            loc_time.strftime("%Y-%m-%d %H:%M:%S") for loc_time in local_time
+        ],
+        "pixel_value": pixel_value,
+        "interval": interval,
+        "layer": layer,
+        "bbox": [min_x, min_y, max_x, max_y],
+        "reference_time": reference_time,
+        # Values of every fetched layer (used by --previous)
+        "time": [timestep.strftime("%Y-%m-%d %H:%M:%S") for timestep in time],
+        "values": values,
+        **exceedance,
+        "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "business_hours": business_hours,
+    }
+
+
+# Streaming mode: the values are yielded as records while they are fetched,
+# so that the next stage starts before the end of the horizon. The first
+# record holds the entries of values.json that are not per timestep, the
+# following ones the values of one timestep (one value per location in
+# batch mode), in order.
+def stream(
+    pos_x: Optional[str] = None,
+    pos_y: Optional[str] = None,
+    locations_path: Optional[str] = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    no_cache: bool = False,
+    workers: int = 8,
+    timeout: float = 30,
+    retries: int = 3,
+    hedge_percentile: Optional[float] = None,
+    rate_limit: Optional[float] = None,
+    info_format: str = featureinfo.TEXT,
+    all_hours: bool = False,
+) -> Iterator[dict]:
+    layer = LAYER
+    client = GeoMetClient(
+        workers=workers,
+        timeout=timeout,
+        retries=retries,
+        hedge_percentile=hedge_percentile,
+        rate_limit=rate_limit,
+    )
+    cache = None
+    values = None
+    try:
+        start_time, end_time, interval = time_parameters(layer, client)
+        time, local_time = forecast_times(start_time, end_time, interval, TIME_ZONE)
+        business_hours = None
+        if not all_hours:
+            time, local_time = business_timesteps(time, local_time)
+            business_hours = {"opening": OPENING, "closing": CLOSING}
+        header = {
+            "interval": interval,
+            "layer": layer,
+            "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "business_hours": business_hours,
+        }
+
+        if locations_path is not None:
+            import numpy
+
+            from locations import read_locations, shard
+            from raster import RasterRequestInput, raster_stream, union_bbox
+
+            locations = read_locations(locations_path)
+            if shard_count > 1:
+                locations = shard(locations, shard_index, shard_count)
+            x = numpy.array([location.x for location in locations])
+            y = numpy.array([location.y for location in locations])
+            bbox = union_bbox(x, y)
+            header["locations"] = [
+                {"name": location.name, "x": location.x, "y": location.y}
+                for location in locations
+            ]
+            header["shard"] = {"index": shard_index, "count": shard_count}
+            values = (
+                value.tolist()
+                for value in raster_stream(
+                    RasterRequestInput(
+                        layer=layer, time=time, x=x, y=y, bbox=bbox, client=client
+                    )
+                )
+            )
+        else:
+            x, y = float(pos_x), float(pos_y)
+            bbox = (x - 0.25, y - 0.25, x + 0.25, y + 0.25)
+            cache = None if no_cache else ValueCache()
+            values = (
+                value[layer]
+                for value in request_stream(
+                    RequestInput(
+                        layers=[layer],
+                        time=time,
+                        min_x=bbox[0],
+                        min_y=bbox[1],
+                        max_x=bbox[2],
+                        max_y=bbox[3],
+                        client=client,
+                        reference_time=layer_reference_time(layer, client),
+                        cache=cache,
+                        info_format=info_format,
+                    )
+                )
+            )
+        header["bbox"] = list(bbox)
+        yield header
+
+        # The values come first so that their generator runs to its end
+        for value, timestep, loc_time in zip(values, time, local_time):
+            yield {
+                "time": timestep.strftime("%Y-%m-%d %H:%M:%S"),
+                "local_time": loc_time.strftime("%Y-%m-%d %H:%M:%S"),
+                "pixel_value": value,
+            }
+    finally:
+        if values is not None:
+            # The values fetched are cached before the cache is closed
+            values.close()
+        client.close()
+        if cache is not None:
+            cache.close()
+
+
+# One JSON record per line, flushed so that the reader gets every
+# record as soon as it is written
+def write_stream(records: Iterator[dict], file: IO[str]) -> None:
+    count = -1
+    for count, record in enumerate(records):
+        file.write(json.dumps(record) + "\n")
+        file.flush()
+    logger.info(f"{max(count, 0)} timesteps streamed")
+
+
+# Add the values of a model run (one list per location) to the archive
+# of the layer. The locations are named by their coordinates outside of
+# the batch mode.
+def archive_values(
+    archive_dir: str,
+    layer: str,
+    reference_time: Optional[str],
+    locations: list[str],
+    time: list[datetime],
+    values: list[list[float]],
+) -> None:
+    from archive import ForecastArchive
+
+    if reference_time is None:
+        logger.info(f"{layer} has no reference time, values not archived")
+        return
+    archive = ForecastArchive(layer, archive_dir)
+    added = sum(
+        archive.append(reference_time, location, time, location_values)
+        for location, location_values in zip(locations, values)
+    )
+    logger.info(f"{added} locations of the {reference_time} run archived for {layer}")
+
+
+# Batch mode: the probabilities of all the locations of the file
+# are sampled from one raster per timestep
+def batch(
+    locations_path: str,
+    layer: str,
+    time: list[datetime],
+    local_time: list[datetime],
+    interval: int,
+    client: GeoMetClient,
+    start_time: datetime,
+    end_time: datetime,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    archive_dir: Optional[str] = None,
+    plot: bool = True,
+    plot_processes: int = 1,
+) -> dict:
+    import numpy
+
+    from locations import read_locations, shard
+    from raster import RasterRequestInput, request_raster, union_bbox
+
+    locations = read_locations(locations_path)
+    logger.info(f"Locations: {len(locations)} read from {locations_path}")
+    if shard_count > 1:
+        locations = shard(locations, shard_index, shard_count)
+        logger.info(f"Shard {shard_index}/{shard_count}: {len(locations)} locations")
+
+    x = numpy.array([location.x for location in locations])
+    y = numpy.array([location.y for location in locations])
+    bbox = union_bbox(x, y)
+    logger.info(f"bbox: {bbox}")
+
+    logger.info("GetCoverage request")
+    pixel_value = request_raster(
+        RasterRequestInput(layer=layer, time=time, x=x, y=y, bbox=bbox, client=client)
+    )
 
-    # Create the plot with the fig function and show the plot
-    logger.info("Creating the plot")
-    logger.info(f"x: {local_time}")
-    logger.info(f"y: {pixel_value}")
-    logger.info(f"y2: {y2}")
-    logger.info(f"y2label: {y2label}")
-    fig(
-        x=local_time,
-        y=pixel_value,
-        title=(
-            "Probability of getting 5 mm or more of precipitations between"
-            + f"\n{local_time[0]} and {local_time[-1]} (local time)"
-        ),
-        xlabel="\nDate and time",
-        ylabel="Probability of getting 5 mm\nor more of precipitations (%)",
-        ylim=(-10, 110),
-        y2=y2,
-        y2label=y2label,
+    if archive_dir is not None:
+        archive_values(
+            archive_dir,
+            layer,
+            layer_reference_time(layer, client),
+            [location.name for location in locations],
+            time,
+            pixel_value.tolist(),
+        )
+
+    if plot:
+        logger.info(f"Creating {len(locations)} plots")
+        save_figs(
+            [
+                (
+                    os.path.join(OUTPUT_DIR, f"probability_of_rain-{location.name}.png"),
+                    probability_plot(local_time, values.tolist()),
+                )
+                for location, values in zip(locations, pixel_value)
+            ],
+            processes=plot_processes,
+        )
+        logger.info("Plots saved")
+
+    return {
+        "local_time": [
+            loc_time.strftime("%Y-%m-%d %H:%M:%S") for loc_time in local_time
+        ],
+        "locations": [
+            {"name": location.name, "x": location.x, "y": location.y}
+            for location in locations
+        ],
+        # One list of values per location
+        "pixel_value": pixel_value.tolist(),
+        "interval": interval,
+        "layer": layer,
+        "bbox": list(bbox),
+        # Time dimension of the layer, whatever the timesteps fetched
+        "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "shard": {"index": shard_index, "count": shard_count},
+    }
+
+
+# Gridded mode: the full raster of the bbox at every timestep is saved as
+# a (timesteps, rows, columns) cube in grid.npy, memory-mapped while it is
+# fetched. The center pixel is kept as pixel_value for the next stages.
+def gridded(
+    bbox: tuple[float, float, float, float],
+    layer: str,
+    time: list[datetime],
+    local_time: list[datetime],
+    interval: int,
+    client: GeoMetClient,
+    start_time: datetime,
+    end_time: datetime,
+    plot: bool = True,
+) -> dict:
+    import numpy
+
+    from raster import CubeRequestInput, grid_coordinates, pixel_indices, request_cube
+
+    logger.info(f"bbox: {bbox}")
+    logger.info("GetCoverage request")
+    cube = request_cube(
+        CubeRequestInput(layer=layer, time=time, bbox=bbox, client=client),
+        path=os.path.join(TEMP_OUTPUT_DIR, GRID_FILE),
+    )
+    logger.info(f"Grid of {cube.shape[1]} rows and {cube.shape[2]} columns saved")
+
+    size = (cube.shape[2], cube.shape[1])
+    x, y = grid_coordinates(bbox, size)
+    min_x, min_y, max_x, max_y = bbox
+    rows, cols = pixel_indices(
+        numpy.array([(min_x + max_x) / 2]), numpy.array([(min_y + max_y) / 2]), bbox, size
     )
+    pixel_value = cube[:, rows[0], cols[0]].tolist()
 
-    logger.info("Saving the plot")
-    plt.savefig(os.path.join(OUTPUT_DIR, "probability_of_rain.png"))
-
-    logger.info("Plot saved")
-    with open(os.path.join(TEMP_OUTPUT_DIR, "values.json"), "w") as file:
-        json.dump(
-            {
-                "local_time": [
-                    loc_time.strftime("%Y-%m-%d %H:%M:%S") for loc_time in local_time
-                ],
-                "pixel_value": pixel_value,
-                "interval": interval,
-                "layer": layer,
-                "bbox": [min_x, min_y, max_x, max_y],
-                "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
-            },
-            file,
+    if plot:
+        logger.info("Creating the plot")
+        save_fig(
+            os.path.join(OUTPUT_DIR, "probability_of_rain.png"),
+            **probability_plot(local_time, pixel_value),
         )
-    
+        logger.info("Plot saved")
+
+    return {
+        "local_time": [
+            loc_time.strftime("%Y-%m-%d %H:%M:%S") for loc_time in local_time
+        ],
+        "pixel_value": pixel_value,
+        "interval": interval,
+        "layer": layer,
+        "bbox": list(bbox),
+        # Cube file (relative to values.json) and coordinates of its pixels
+        "grid": {"path": GRID_FILE, "x": x.tolist(), "y": y.tolist()},
+        # Time dimension of the layer, whatever the timesteps fetched
+        "start_time": start_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "end_time": end_time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
 
 
 if __name__ == "__main__":
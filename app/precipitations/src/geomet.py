@@ -0,0 +1,347 @@
+# Importation of Python modules
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import concurrent.futures
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+import logging
+import os
+import random
+import threading
+import time
+
+# The following modules must first be installed to use
+# this code out of Jupyter Notebook
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+GEOMET_URL = os.getenv("GEOMET_URL", "https://geo.weather.gc.ca/geomet")
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+# Errors after which a request is sent again
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Number of latencies kept to compute the hedging delay, and
+# number needed before hedging starts
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+
+
+# Client-side rate limiter (token bucket shared by all the threads)
+class RateLimiter:
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+
+    # Take a token only if one is available right away
+    def try_acquire(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+# HTTP client for the GeoMet WMS service sharing one pool of
+# keep-alive connections between all the worker threads.
+# Each request has a deadline of `timeout` seconds for the whole answer
+# (it is abandoned and its connection closed after that) and is retried
+# up to `retries` times with a jittered exponential backoff. With
+# `hedge_percentile`, a duplicate request is sent when the answer takes
+# longer than that percentile of the recent latencies, and the first
+# answer is used. `rate_limit` caps the number of requests per second,
+# duplicates included: a request waits for its token before its deadline
+# and hedging delay start, and a duplicate is only sent when a token is
+# available right away.
+class GeoMetClient:
+    def __init__(
+        self,
+        url: str = GEOMET_URL,
+        workers: int = 8,
+        timeout: float = 30,
+        retries: int = 3,
+        backoff: float = 0.5,
+        hedge_percentile: Optional[float] = None,
+        rate_limit: Optional[float] = None,
+    ):
+        self.url = url
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_percentile = hedge_percentile
+        self.rate_limiter = None
+        if rate_limit:
+            self.rate_limiter = RateLimiter(rate_limit, burst=self.workers)
+        self.latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self.latencies_lock = threading.Lock()
+        self.hedges = 0
+        # Threads sending the requests, so that the callers can abandon
+        # them at their deadline (room is left for the abandoned ones and
+        # for the callers sharing the client, like the service threads)
+        threads = 4 * self.workers
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+        self.session = requests.Session()
+        # One connection per thread, so that no request waits for a free
+        # socket nor opens a connection that is not kept
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=threads)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+    def get(self, params: dict) -> bytes:
+        for attempt in range(self.retries + 1):
+            try:
+                # The time spent waiting for the rate limiter is not
+                # part of the deadline nor of the hedging delay
+                if self.rate_limiter is not None:
+                    self.rate_limiter.acquire()
+                if self.hedge_percentile is None:
+                    return self._get(params)
+                return self._hedged_get(params)
+            except requests.RequestException as error:
+                retry = not isinstance(error, requests.HTTPError) or (
+                    error.response is not None
+                    and error.response.status_code in RETRY_STATUS
+                )
+                if not retry or attempt == self.retries:
+                    raise
+                # Exponential backoff with full jitter
+                delay = random.uniform(0, self.backoff * 2**attempt)
+                logger.warning(f"Request failed ({error}), retrying in {delay:.2f} s")
+                metrics.count("geomet.retries")
+                time.sleep(delay)
+
+    # Send a request and read its whole answer, its latency is recorded to
+    # compute the hedging delay and in the metrics of the running stage.
+    # The response is added to `responses` as soon as its headers are
+    # received, so that it can be closed by the caller at the deadline.
+    # `started` is set when the request leaves the queue of the executor.
+    def _send(
+        self, params: dict, responses: list, started: Optional[threading.Event] = None
+    ) -> bytes:
+        if started is not None:
+            started.set()
+        start = time.monotonic()
+        response = self.session.get(
+            self.url, params=params, timeout=self.timeout, stream=True
+        )
+        responses.append(response)
+        content = response.content
+        latency = time.monotonic() - start
+        metrics.observe_request(params["REQUEST"], latency, len(content))
+        response.raise_for_status()
+        with self.latencies_lock:
+            self.latencies.append(latency)
+        return content
+
+    # The requests still running at the deadline are abandoned, closing
+    # their connection stops the thread reading a slow answer
+    def _abandon(self, futures: set, responses: list) -> None:
+        for future in futures:
+            future.cancel()
+        for response in responses:
+            response.close()
+        metrics.count("geomet.deadlines")
+        raise requests.Timeout(f"No complete answer within {self.timeout} s")
+
+    # Submit a request to the executor and wait until it is sent: the time
+    # spent in the queue, behind the requests of the other callers, is not
+    # part of its deadline
+    def _submit(self, params: dict, responses: list) -> concurrent.futures.Future:
+        started = threading.Event()
+        future = self.executor.submit(self._send, params, responses, started)
+        # Cancelled by close() before it was sent
+        future.add_done_callback(lambda _: started.set())
+        started.wait()
+        return future
+
+    def _get(self, params: dict) -> bytes:
+        responses = []
+        future = self._submit(params, responses)
+        try:
+            return future.result(timeout=self.timeout)
+        except concurrent.futures.TimeoutError:
+            self._abandon({future}, responses)
+
+    # Delay after which a duplicate of a request is sent
+    # (None until enough latencies have been recorded)
+    def hedge_delay(self) -> Optional[float]:
+        with self.latencies_lock:
+            if len(self.latencies) < LATENCY_MIN_SAMPLES:
+                return None
+            latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))
+        return latencies[index]
+
+    def _hedged_get(self, params: dict) -> bytes:
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._get(params)
+        responses = []
+        pending = {self._submit(params, responses)}
+        deadline = time.monotonic() + self.timeout
+        done, pending = wait(pending, timeout=min(delay, self.timeout))
+        # Slower than the percentile: send a duplicate, unless it would
+        # have to wait for the rate limiter
+        if not done and (self.rate_limiter is None or self.rate_limiter.try_acquire()):
+            self.hedges += 1
+            metrics.count("geomet.hedges")
+            pending.add(self.executor.submit(self._send, params, responses))
+        error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    # The other answer is not needed anymore
+                    for other in responses:
+                        other.close()
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                raise error
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._abandon(pending, responses)
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+    # WMS 1.3.0 GetFeatureInfo query on a single pixel of the bbox
+    def getfeatureinfo(
+        self,
+        layers: list[str],
+        bbox: tuple[float, float, float, float],
+        time: datetime,
+        size: tuple[int, int] = (100, 100),
+        xy: tuple[int, int] = (50, 50),
+        info_format: str = "text/plain",
+        feature_count: int = 1,
+        reference_time: Optional[str] = None,
+    ) -> bytes:
+        min_x, min_y, max_x, max_y = bbox
+        params = {
+            "SERVICE": "WMS",
+            "VERSION": "1.3.0",
+            "REQUEST": "GetFeatureInfo",
+            "LAYERS": ",".join(layers),
+            "QUERY_LAYERS": ",".join(layers),
+            "STYLES": "",
+            "CRS": "EPSG:4326",
+            # EPSG:4326 has a latitude/longitude axis order in WMS 1.3.0
+            "BBOX": f"{min_y},{min_x},{max_y},{max_x}",
+            "WIDTH": str(size[0]),
+            "HEIGHT": str(size[1]),
+            "FORMAT": "image/jpeg",
+            "I": str(xy[0]),
+            "J": str(xy[1]),
+            "INFO_FORMAT": info_format,
+            "FEATURE_COUNT": str(feature_count),
+            "TIME": time.isoformat() + "Z",
+        }
+        if reference_time is not None:
+            # Pin the model run so that the values match their cache key
+            params["DIM_REFERENCE_TIME"] = reference_time
+        return self.get(params)
+
+    # WMS 1.3.0 GetMap query of a single layer over the bbox
+    def getmap(
+        self,
+        layer: str,
+        bbox: tuple[float, float, float, float],
+        time: datetime,
+        size: tuple[int, int],
+        format: str = "image/tiff",
+    ) -> bytes:
+        min_x, min_y, max_x, max_y = bbox
+        params = {
+            "SERVICE": "WMS",
+            "VERSION": "1.3.0",
+            "REQUEST": "GetMap",
+            "LAYERS": layer,
+            "STYLES": "",
+            "CRS": "EPSG:4326",
+            # EPSG:4326 has a latitude/longitude axis order in WMS 1.3.0
+            "BBOX": f"{min_y},{min_x},{max_y},{max_x}",
+            "WIDTH": str(size[0]),
+            "HEIGHT": str(size[1]),
+            "FORMAT": format,
+            "TIME": time.isoformat() + "Z",
+        }
+        return self.get(params)
+
+    # WCS 2.0.1 GetCoverage query of a single layer over the bbox: unlike
+    # GetMap, whose images are rendered with the style of the layer, the
+    # coverage holds the values of the layer (a float GeoTIFF)
+    def getcoverage(
+        self,
+        layer: str,
+        bbox: tuple[float, float, float, float],
+        time: datetime,
+        size: tuple[int, int],
+        format: str = "image/tiff",
+    ) -> bytes:
+        min_x, min_y, max_x, max_y = bbox
+        params = {
+            "SERVICE": "WCS",
+            "VERSION": "2.0.1",
+            "REQUEST": "GetCoverage",
+            "COVERAGEID": layer,
+            "SUBSETTINGCRS": "EPSG:4326",
+            "OUTPUTCRS": "EPSG:4326",
+            "SUBSET": [f"x({min_x},{max_x})", f"y({min_y},{max_y})"],
+            "SCALESIZE": f"x({size[0]}),y({size[1]})",
+            "FORMAT": format,
+            "TIME": time.isoformat() + "Z",
+        }
+        return self.get(params)
+
+    # Apply fn to every item with at most `workers` requests in flight,
+    # the results are yielded in the order of the items as soon as
+    # they are available
+    def imap(self, fn: Callable[[T], R], items: Iterable[T]) -> Iterator[R]:
+        items = list(items)
+        if self.workers == 1 or len(items) < 2:
+            for item in items:
+                yield fn(item)
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            yield from executor.map(fn, items)
+
+    # Same as imap, the results are returned in a list
+    def map(self, fn: Callable[[T], R], items: Iterable[T]) -> list[R]:
+        return list(self.imap(fn, items))
@@ -0,0 +1,46 @@
+# Importation of Python modules
+from dataclasses import dataclass
+import csv
+import math
+
+
+@dataclass
+class Location:
+    name: str
+    x: float
+    y: float
+
+
+# Read a CSV file of locations with the columns x, y and
+# optionally name (the row number is used when there is no name)
+def read_locations(path: str) -> list[Location]:
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+        return [
+            Location(
+                name=row.get("name") or str(index),
+                x=float(row["x"]),
+                y=float(row["y"]),
+            )
+            for index, row in enumerate(reader)
+        ]
+
+
+# Contiguous part of the items processed by one shard out of shard_count
+# (the shards differ by at most one item)
+def shard(items: list, shard_index: int, shard_count: int) -> list:
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} not in [0, {shard_count})")
+    if shard_count > len(items):
+        raise ValueError(f"{shard_count} shards for only {len(items)} locations")
+    start = shard_index * len(items) // shard_count
+    end = (shard_index + 1) * len(items) // shard_count
+    return items[start:end]
+
+
+# Column and row of the cell of a native grid (see capabilities.layer_grid)
+# containing a coordinate: all the points of a cell get the same values
+def grid_cell(x: float, y: float, grid: dict) -> tuple[int, int]:
+    min_x, min_y, max_x, max_y = grid["bbox"]
+    resolution_x, resolution_y = grid["resolution"]
+    return math.floor((x - min_x) / resolution_x), math.floor((max_y - y) / resolution_y)
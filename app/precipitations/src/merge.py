@@ -0,0 +1,94 @@
+# Importation of Python modules
+import glob
+import json
+import logging
+import os
+
+# The following modules must first be installed to use
+# this code out of Jupyter Notebook
+import click
+
+from dataio import (
+    LOCATION_KEYS,
+    VALUES_FILES,
+    load_values,
+    output_options,
+    parse_times,
+    save_values,
+)
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TEMP_OUTPUT_DIR = os.path.join("./", "data")
+
+
+# Reduce step of a sharded run: merge the values.json (or values.npz)
+# written by the shards (in any sub-directory of input_dir)
+@click.command()
+@click.option(
+    "--input_dir",
+    type=click.Path(exists=True, file_okay=False),
+    required=True,
+    help="Directory holding the values.json of every shard",
+)
+@output_options
+def main(input_dir: str, output_format: str) -> None:
+    # add and configure logging
+    logging.basicConfig(level=logging.INFO)
+
+    paths = sorted(
+        path
+        for name in VALUES_FILES.values()
+        for path in glob.glob(os.path.join(input_dir, "**", name), recursive=True)
+    )
+    logger.info(f"{len(paths)} shards found in {input_dir}")
+    shards = []
+    for path in paths:
+        if path.endswith(".npz"):
+            shards.append(load_values(path))
+        else:
+            with open(path) as file:
+                shards.append(json.load(file))
+
+    data = merge_values(shards)
+    os.makedirs(TEMP_OUTPUT_DIR, exist_ok=True)
+    save_values(data, os.path.join(TEMP_OUTPUT_DIR, VALUES_FILES[output_format]))
+    logger.info(f"Values of {len(data['locations'])} locations saved")
+    metrics.write()
+
+
+# values.json of all the locations from the values.json of every shard
+# (of fetch_data or of prediction). The shards are put back in order and
+# must all be present.
+@metrics.stage("merge")
+def merge_values(shards: list[dict]) -> dict:
+    if not shards:
+        raise ValueError("No shard to merge")
+    shards = sorted(shards, key=lambda data: data["shard"]["index"])
+    count = shards[0]["shard"]["count"]
+    indices = [data["shard"]["index"] for data in shards]
+    if indices != list(range(count)):
+        raise ValueError(f"Shards {indices} do not match a run of {count} shards")
+    local_time = parse_times(shards[0]["local_time"])
+    for data in shards[1:]:
+        if parse_times(data["local_time"]) != local_time:
+            raise ValueError(f"Shard {data['shard']['index']} has other timesteps")
+
+    merged = {key: value for key, value in shards[0].items() if key != "shard"}
+    for key in LOCATION_KEYS:
+        if key in merged:
+            merged[key] = [item for data in shards for item in list(data[key])]
+    # bbox covering the bbox of every shard
+    bboxes = [data["bbox"] for data in shards]
+    merged["bbox"] = [
+        min(bbox[0] for bbox in bboxes),
+        min(bbox[1] for bbox in bboxes),
+        max(bbox[2] for bbox in bboxes),
+        max(bbox[3] for bbox in bboxes),
+    ]
+    return merged
+
+
+if __name__ == "__main__":
+    main()
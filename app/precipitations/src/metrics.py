@@ -0,0 +1,183 @@
+# Importation of Python modules
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.path.join("./", "metrics")
+METRICS_FILE = "metrics.json"
+
+# Upper bounds (seconds) of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Number of latest latencies kept to compute the percentiles
+LATENCY_SAMPLES = 1000
+
+# Name under which the measures taken outside of any stage are recorded
+NO_STAGE = "other"
+
+
+# Latencies of one type of request in a fixed amount of memory, however
+# long the process runs: the count, sum, maximum and bucket counts of all
+# the latencies and the latest ones for the percentiles
+@dataclass
+class Latencies:
+    count: int = 0
+    sum: float = 0
+    max: Optional[float] = None
+    buckets: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    recent: deque = field(default_factory=lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    def add(self, latency: float) -> None:
+        self.count += 1
+        self.sum += latency
+        self.max = latency if self.max is None else max(self.max, latency)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.recent.append(latency)
+
+
+# Measures of one stage (fetch_data, prediction, profit or stac)
+@dataclass
+class StageMetrics:
+    started_at: Optional[str] = None
+    wall_time: float = 0
+    # Latencies (seconds) and bytes received per type of WMS request
+    latencies: dict[str, Latencies] = field(default_factory=dict)
+    bytes: dict[str, int] = field(default_factory=dict)
+    # Hits and misses per cache
+    caches: dict[str, list[int]] = field(default_factory=dict)
+    counters: dict[str, int] = field(default_factory=dict)
+
+
+# Measures of this process, the requests of the worker threads are
+# recorded in the stage running in the main thread
+_lock = threading.Lock()
+_stages: dict[str, StageMetrics] = {}
+_current: list[str] = []
+
+
+def _stage() -> StageMetrics:
+    name = _current[-1] if _current else NO_STAGE
+    return _stages.setdefault(name, StageMetrics())
+
+
+# Record the wall time of a stage (usable as a decorator)
+@contextmanager
+def stage(name: str):
+    with _lock:
+        metrics = _stages.setdefault(name, StageMetrics())
+        if metrics.started_at is None:
+            metrics.started_at = datetime.now(timezone.utc).isoformat()
+        _current.append(name)
+    start = time.perf_counter()
+    try:
+        yield metrics
+    finally:
+        with _lock:
+            metrics.wall_time += time.perf_counter() - start
+            _current.pop()
+
+
+# Record the latency and the size of the answer of a WMS request
+def observe_request(request: str, latency: float, size: int) -> None:
+    with _lock:
+        metrics = _stage()
+        metrics.latencies.setdefault(request, Latencies()).add(latency)
+        metrics.bytes[request] = metrics.bytes.get(request, 0) + size
+
+
+# Record the hits and misses of a cache lookup
+def observe_cache(cache: str, hits: int, misses: int) -> None:
+    with _lock:
+        counts = _stage().caches.setdefault(cache, [0, 0])
+        counts[0] += hits
+        counts[1] += misses
+
+
+def count(name: str, value: int = 1) -> None:
+    with _lock:
+        counters = _stage().counters
+        counters[name] = counters.get(name, 0) + value
+
+
+def _percentile(values: list[float], percentile: float) -> float:
+    index = min(len(values) - 1, int(len(values) * percentile / 100))
+    return values[index]
+
+
+# Summary and bucket counts of the latencies of a type of request
+# (the percentiles are the ones of the latest LATENCY_SAMPLES latencies)
+def histogram(latencies: Latencies) -> dict:
+    recent = sorted(latencies.recent)
+    bounds = [str(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+    return {
+        "count": latencies.count,
+        "sum": latencies.sum,
+        "p50": _percentile(recent, 50) if recent else None,
+        "p95": _percentile(recent, 95) if recent else None,
+        "p99": _percentile(recent, 99) if recent else None,
+        "max": latencies.max,
+        # Number of latencies up to each bound (and above the last one)
+        "buckets": dict(zip(bounds, latencies.buckets)),
+    }
+
+
+# Content of metrics.json for the stages run by this process
+def summary() -> dict:
+    with _lock:
+        stages = {}
+        for name, metrics in _stages.items():
+            caches = {}
+            for cache, (hits, misses) in metrics.caches.items():
+                total = hits + misses
+                caches[cache] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": hits / total if total else None,
+                }
+            stages[name] = {
+                "started_at": metrics.started_at,
+                "wall_time": metrics.wall_time,
+                "requests": {
+                    request: histogram(latencies)
+                    for request, latencies in metrics.latencies.items()
+                },
+                "bytes": dict(metrics.bytes),
+                "caches": caches,
+                "counters": dict(metrics.counters),
+            }
+    return {"stages": stages}
+
+
+# Forget the measures taken so far
+def reset() -> None:
+    with _lock:
+        _stages.clear()
+
+
+# Write metrics.json. The stages already in the file (written by the
+# previous stages run in the same directory) are kept.
+def write(output_dir: str = METRICS_DIR) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, METRICS_FILE)
+    try:
+        with open(path) as file:
+            content = json.load(file)
+    except (OSError, ValueError):
+        content = {}
+    stages = content.get("stages", {})
+    stages.update(summary()["stages"])
+    with open(path + ".tmp", "w") as file:
+        json.dump({"stages": stages}, file, indent=2)
+    os.replace(path + ".tmp", path)
+    logger.info(f"Metrics saved to {path}")
+    return path
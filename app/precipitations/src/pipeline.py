@@ -0,0 +1,101 @@
+# Importation of Python modules
+import logging
+import os
+
+# The following modules must first be installed to use
+# this code out of Jupyter Notebook
+import click
+
+from dataio import save_values
+from fetch_data import TEMP_OUTPUT_DIR, fetch
+import metrics
+from prediction import predict
+from profit import profit_table
+from stac import stac
+
+logger = logging.getLogger(__name__)
+
+
+# Whole workflow (fetch_data -> prediction -> profit -> stac) in a single
+# process, the stages exchange Python objects instead of values.json
+@click.command()
+@click.option("--pos_x", type=str, help="X coordinate")
+@click.option("--pos_y", type=str, help="Y coordinate")
+@click.option(
+    "--locations",
+    "locations_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="CSV file of locations (columns x, y and name) fetched in batch mode",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Number of concurrent WMS requests",
+)
+@click.option(
+    "--grid",
+    is_flag=True,
+    help="Fetch the full raster of the bbox at every timestep (saved in data/grid.npy)",
+)
+@click.option(
+    "--bbox",
+    type=str,
+    help="Bbox (min_x,min_y,max_x,max_y) of the gridded mode, "
+    "0.5° around the coordinates by default",
+)
+@click.option("--no_plot", is_flag=True, help="Only save the values, without plots")
+@click.option(
+    "--plot_processes",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of processes rendering the plots of the batch mode",
+)
+@click.option("--skip_stac", is_flag=True, help="Do not write the STAC items")
+def main(
+    pos_x: str,
+    pos_y: str,
+    locations_path: str,
+    workers: int,
+    grid: bool,
+    bbox: str,
+    no_plot: bool,
+    plot_processes: int,
+    skip_stac: bool,
+) -> None:
+    # add and configure logging
+    logging.basicConfig(level=logging.INFO)
+
+    logger.info("Fetching data")
+    fetch_values = fetch(
+        pos_x=pos_x,
+        pos_y=pos_y,
+        locations_path=locations_path,
+        workers=workers,
+        grid=grid,
+        bbox=bbox,
+        plot=not no_plot,
+        plot_processes=plot_processes,
+    )
+
+    logger.info("Calculating the predictions")
+    calculated_values = predict(
+        fetch_values, plot=not no_plot, plot_processes=plot_processes
+    )
+    save_values(calculated_values, os.path.join(TEMP_OUTPUT_DIR, "values.json"))
+
+    logger.info("Calculating the profits")
+    profit_table(calculated_values)
+
+    if not skip_stac:
+        logger.info("Writing STAC")
+        stac(calculated_values)
+
+    metrics.write()
+    logger.info("Pipeline completed")
+
+
+if __name__ == "__main__":
+    main()
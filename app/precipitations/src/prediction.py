@@ -1,108 +1,293 @@
 # Importation of Python modules
+import csv
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
+from typing import IO, Iterable, Optional
 import logging
 import os
 
 # The following modules must first be installed to use
 # this code out of Jupyter Notebook
-import matplotlib.pyplot as plt
+import numpy
 import click
 
-from utils import fig
+from business_hours import CLOSING, OPENING
+from dataio import (
+    TIME_FORMAT,
+    VALUES_FILES,
+    input_options,
+    load_input,
+    output_options,
+    parse_times,
+    save_values,
+    shard_options,
+    shard_values,
+)
+import metrics
+from utils import save_figs
 
-# add and configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 OUTPUT_DIR = os.path.join("./", "plots")
 TEMP_OUTPUT_DIR = os.path.join("./", "data")
 
-logger.info("Creating output directory")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(TEMP_OUTPUT_DIR, exist_ok=True)
+# Umbrellas sold per day in average when there is less than 30%
+# chance that there will be a minimum of 5 mm of precipitations
+BASE = 3
 
-@click.command()
-@click.option("--input_data", required=True, type=str)
-def main(input_data: str):
-    logger.info("Importing data from the command line")
-    logger.info(input_data)
-    import_data = json.loads(input_data)
-    logger.info(f"Data imported: {import_data}")
+# Profits per umbrella
+UMBRELLA_PROFIT = 10.00
 
-    local_time = [datetime.strptime(loc_time, "%Y-%m-%d %H:%M:%S") for loc_time in import_data["local_time"]]
-    logger.info(f"Local time: {local_time} with length: {len(local_time)}")
-    pixel_value =  import_data["pixel_value"]
-    logger.info(f"Pixel value: {pixel_value} with length: {len(pixel_value)}")
-    interval = import_data["interval"]
-    logger.info(f"Interval: {interval}")
+# Slope calculation data
+# When the probability of precipitations is 30%...
+X1 = 30
+# ... 10 umbrellas are sold each hour
+Y1 = 10
+# When the probability of precipitations is 100%...
+X2 = 100
+# ... 30 umbrellas are sold each hour
+Y2 = 30
+
+# Distribution model (--thresholds of fetch_data): umbrellas sold each hour
+# when the quantity of precipitations of a timestep reaches each threshold
+# (mm), the rate of the closest lower threshold applies between two
+# thresholds (nothing is sold below the smallest one). These rates are
+# assumptions of this model, they are not derived from X1/Y1/X2/Y2 which
+# are about the probability of 5 mm or more.
+RAIN_SALES_PER_HOUR = {1: 10, 5: 20, 10: 25, 25: 30}
+# As in the probability model, no umbrella is sold for the rain while the
+# probability (%) of reaching the smallest threshold is at most this
+RAIN_SALES_MIN_PROBABILITY = X1
+
+# Probability from which a pixel counts in the rainy area fraction
+# of the gridded mode
+AREA_THRESHOLD = X1
+
+
+# Hour of the day (float) of each timestep
+def hour_of_day(local_time: list[datetime]) -> numpy.ndarray:
+    local_time = numpy.asarray(local_time, dtype="datetime64[s]")
+    seconds = (local_time - local_time.astype("datetime64[D]")).astype(numpy.int64)
+    return seconds / 3600
 
-    # Umbrellas sold per day in average when there is less than 30%
-    # chance that there will be a minimum of 5 mm of precipitations
-    logger.info("Calculating the number of umbrellas sold per day")
-    base = 3
-
-    # Profits per umbrella
-    logger.info("Calculating the profits per umbrella")
-    umbrella_profit = 10.00
-
-    # Slope calculation data
-    # When the probability of precipitations is 30%...
-    x1 = 30
-    # ... 10 umbrellas are sold each hour
-    y1 = 10
-    # When the probability of precipitations is 100%...
-    x2 = 100
-    # ... 30 umbrellas are sold each hour
-    y2 = 30
+
+# Prediction times that are within the open hours
+def open_hours_mask(
+    local_time: list[datetime], opening: float = OPENING, closing: float = CLOSING
+) -> numpy.ndarray:
+    hour = hour_of_day(local_time)
+    return (hour > opening) & (hour < closing)
+
+
+# Cumulative anticipated profits of umbrella sales for every location and
+# every scenario at once.
+# `probability` has the timesteps on its last axis (e.g. locations x timesteps).
+# The scenario parameters are scalars or 1-D arrays of the same length;
+# with arrays the result gets a leading scenario axis.
+def cumulative_profit(
+    local_time: list[datetime],
+    probability,
+    interval: int,
+    base=BASE,
+    umbrella_profit=UMBRELLA_PROFIT,
+    opening=OPENING,
+    closing=CLOSING,
+) -> numpy.ndarray:
+    probability = numpy.asarray(probability, dtype=float)
+    hour = hour_of_day(local_time)
+
+    # Scenario parameters broadcast against the probability axes
+    def scenario(value) -> numpy.ndarray:
+        value = numpy.asarray(value, dtype=float)
+        return value.reshape(value.shape + (1,) * probability.ndim)
+
+    base, umbrella_profit = scenario(base), scenario(umbrella_profit)
+    opening, closing = scenario(opening), scenario(closing)
 
     # Slope calculation
-    slope = (y2 - y1) / (x2 - x1)
+    slope = (Y2 - Y1) / (X2 - X1)
 
-    # Open hours
-    opening = datetime.strptime("09:00:00", "%H:%M:%S")
-    closing = datetime.strptime("21:00:00", "%H:%M:%S")
-    logger.info(f"Opening hours: {opening} - Closing hours: {closing}")
+    is_open = (hour > opening) & (hour < closing)
 
-    # Prediction times that are within the open hours
-    open_hours = []
-    for timestep in local_time:
-        if timestep.time() > opening.time() and timestep.time() < closing.time():
-            open_hours.append(timestep)
-
-    # Number of umbrellas sold each day independently of meteorological conditions
-    opening_interval = (opening + timedelta(hours=interval)).time()
-    umbrella: list[int] = []
-    logger.info("Calculating the number of umbrellas sold each day")
-    for timestep in local_time:
-        new_day = timestep.time() < opening_interval
-        if (umbrella == [] or new_day) and timestep in open_hours:
-            umbrella.append(base)
-        else:
-            umbrella.append(0)
+    # Number of umbrellas sold each day independently of meteorological
+    # conditions, at the first open timestep of the day (or of the forecast)
+    new_day = hour < (opening + interval) % 24
+    new_day[..., 0] = True
+    sold = numpy.where(new_day & is_open, base, 0)
 
-    # Number of umbrellas sold and anticipated profits
-    # depending on precipitations probability
-    logger.info("Calculating the number of umbrellas sold and anticipated profits")
-    cumulative_profit = []
-    logger.info("Calculating the cumulative profits")
-    for index, probability in enumerate(pixel_value):
-        # Equation to calculate the number of umbrellas sold per hour
-        eq = y1 + round((probability - 30) * slope)
-        # Equation to calculate the number of umbrellas sold between 2 predictions
-        eq2 = eq * interval
-        if local_time[index] in open_hours and probability > 30:
-            if index == 0:
-                umbrella[index] = umbrella[index] + eq2
-            else:
-                umbrella[index] = umbrella[index] + umbrella[index - 1] + eq2
-        elif index != 0:
-            umbrella[index] = umbrella[index] + umbrella[index - 1]
-        cumulative_profit.append(umbrella[index] * umbrella_profit)
-
-    # Create and show plot
-    logger.info("Creating and showing the plot")
-    fig(
+    # Equation to calculate the number of umbrellas sold per hour
+    eq = Y1 + numpy.round((probability - X1) * slope)
+    # Equation to calculate the number of umbrellas sold between 2 predictions
+    eq2 = eq * interval
+    sold = sold + numpy.where(is_open & (probability > X1), eq2, 0)
+
+    return numpy.cumsum(sold, axis=-1) * umbrella_profit
+
+
+# Cumulative anticipated profits updated one timestep at a time, for the
+# values streamed by fetch_data (same results as cumulative_profit)
+class ProfitAccumulator:
+    def __init__(
+        self,
+        interval: int,
+        base: float = BASE,
+        umbrella_profit: float = UMBRELLA_PROFIT,
+        opening: float = OPENING,
+        closing: float = CLOSING,
+    ):
+        self.interval = interval
+        self.base = base
+        self.umbrella_profit = umbrella_profit
+        self.opening = opening
+        self.closing = closing
+        self.sold = 0
+        self.count = 0
+
+    # Cumulative profits up to this timestep (one per location in batch mode)
+    def add(self, local_time: datetime, probability):
+        probability = numpy.asarray(probability, dtype=float)
+        hour = local_time.hour + local_time.minute / 60 + local_time.second / 3600
+        is_open = self.opening < hour < self.closing
+        new_day = self.count == 0 or hour < (self.opening + self.interval) % 24
+        if self.count == 0:
+            self.sold = numpy.zeros_like(probability)
+        self.count += 1
+        if not is_open:
+            return self.sold * self.umbrella_profit
+
+        slope = (Y2 - Y1) / (X2 - X1)
+        eq2 = (Y1 + numpy.round((probability - X1) * slope)) * self.interval
+        sold = numpy.where(probability > X1, eq2, 0)
+        if new_day:
+            sold = sold + self.base
+        self.sold = self.sold + sold
+        return self.sold * self.umbrella_profit
+
+
+# Hourly sales rate at each threshold (mm) of the exceedance layers
+def sales_rates(thresholds: list[float]) -> numpy.ndarray:
+    return numpy.array(
+        [
+            max(
+                (rate for limit, rate in RAIN_SALES_PER_HOUR.items() if limit <= threshold),
+                default=0,
+            )
+            for threshold in thresholds
+        ],
+        dtype=float,
+    )
+
+
+# Cumulative anticipated profits from the expected umbrella sales given
+# the whole distribution of the quantity of precipitations, with the base
+# sales and open hours of cumulative_profit.
+# `exceedance` holds the probabilities (%) of reaching each threshold, with
+# the thresholds (ascending) on its second to last axis and the timesteps
+# on its last axis.
+def expected_profit(
+    local_time: list[datetime],
+    exceedance,
+    thresholds: list[float],
+    interval: int,
+    base: float = BASE,
+    umbrella_profit: float = UMBRELLA_PROFIT,
+    opening: float = OPENING,
+    closing: float = CLOSING,
+) -> numpy.ndarray:
+    # The probability of exceedance can only decrease with the threshold
+    exceedance = numpy.minimum.accumulate(
+        numpy.asarray(exceedance, dtype=float) / 100, axis=-2
+    )
+    # Expected sales per hour:
+    # sum of P(threshold i <= quantity < threshold i+1) * rate i
+    # = sum of P(quantity >= threshold i) * (rate i - rate i-1)
+    increments = numpy.diff(sales_rates(thresholds), prepend=0)
+    hourly = numpy.einsum("...tk,t->...k", exceedance, increments)
+    # Rain sales only when rain is likely enough
+    rainy = exceedance[..., 0, :] * 100 > RAIN_SALES_MIN_PROBABILITY
+
+    hour = hour_of_day(local_time)
+    is_open = (hour > opening) & (hour < closing)
+    # Daily base sales at the first open timestep of the day
+    new_day = hour < (opening + interval) % 24
+    new_day[0] = True
+    sold = numpy.where(new_day & is_open, base, 0) + numpy.where(
+        is_open & rainy, hourly * interval, 0
+    )
+    return numpy.cumsum(sold, axis=-1) * umbrella_profit
+
+
+# Maximum, mean and fraction of the area above threshold of the
+# probabilities of every timestep of a (timesteps, rows, columns) cube.
+# The cube is read by chunks of timesteps, so that a memory-mapped cube
+# is never loaded in memory at once.
+def regional_aggregates(
+    cube: numpy.ndarray, threshold: float = AREA_THRESHOLD, chunk: int = 64
+) -> dict[str, numpy.ndarray]:
+    timesteps = len(cube)
+    maximum = numpy.empty(timesteps)
+    mean = numpy.empty(timesteps)
+    area_fraction = numpy.empty(timesteps)
+    for start in range(0, timesteps, chunk):
+        block = numpy.asarray(cube[start:start + chunk], dtype=float)
+        block = block.reshape(len(block), -1)
+        # Pixels without data (NaN, as decoded from the GeoTIFF nodata value)
+        # are left out
+        valid = ~numpy.isnan(block)
+        count = valid.sum(axis=1)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            end = start + len(block)
+            maximum[start:end] = numpy.where(
+                count > 0, numpy.where(valid, block, -numpy.inf).max(axis=1), numpy.nan
+            )
+            mean[start:end] = numpy.where(valid, block, 0).sum(axis=1) / count
+            area_fraction[start:end] = (block > threshold).sum(axis=1) / count
+    return {"max": maximum, "mean": mean, "area_fraction": area_fraction}
+
+
+# Refuse the scenarios open outside of the business hours around which
+# fetch_data fetched the timesteps (unless run with --all_hours): the
+# timesteps they would sell on are missing and their profits too low
+def check_scenario_hours(
+    scenarios: dict[str, numpy.ndarray], business_hours: Optional[dict]
+) -> None:
+    if business_hours is None:
+        return
+    outside = (scenarios["opening"] < business_hours["opening"]) | (
+        scenarios["closing"] > business_hours["closing"]
+    )
+    if outside.any():
+        rows = ", ".join(str(index + 1) for index in numpy.flatnonzero(outside))
+        raise click.BadParameter(
+            f"the scenarios {rows} are open outside of the fetched business hours "
+            f"({business_hours['opening']:g}:00 - {business_hours['closing']:g}:00), "
+            "run fetch_data with --all_hours",
+            param_hint="--scenarios",
+        )
+
+
+# Read a CSV file of scenarios with any of the columns
+# base, umbrella_profit, opening and closing
+def read_scenarios(path: str) -> dict[str, numpy.ndarray]:
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        rows = list(csv.DictReader(file))
+    defaults = {
+        "base": BASE,
+        "umbrella_profit": UMBRELLA_PROFIT,
+        "opening": OPENING,
+        "closing": CLOSING,
+    }
+    return {
+        name: numpy.array([float(row.get(name) or default) for row in rows])
+        for name, default in defaults.items()
+    }
+
+
+# Arguments of the fig function for the plot of the anticipated profits
+def prediction_plot(
+    local_time: list[datetime], pixel_value: list[float], cumulative_profit: list[float]
+) -> dict:
+    return dict(
         x=local_time,
         y=pixel_value,
         title=(
@@ -116,23 +301,277 @@ def main(input_data: str):
         y2label="Cumulative anticipated profits ($)",
     )
 
-    plt.savefig(os.path.join(OUTPUT_DIR, "prediction.png"))
-    logger.info("Plot saved")
-
-    with open(os.path.join(TEMP_OUTPUT_DIR, "values.json"), "w") as file:
-        json.dump(
-            {
-                "local_time": [loc_time.strftime("%Y-%m-%d %H:%M:%S") for loc_time in local_time] ,
-                "pixel_value": pixel_value,
-                "cumulative_profit": cumulative_profit,
-                "open_hours": [hour.strftime("%Y-%m-%d %H:%M:%S") for hour in open_hours],
-                "layer": import_data["layer"],
-                "bbox": import_data["bbox"],
-                "start_time": import_data["start_time"],
-                "end_time": import_data["end_time"],
-            },
-            file,
+
+@click.command()
+@input_options
+@click.option(
+    "--input_stream",
+    type=click.File("r", encoding="utf-8", lazy=False),
+    help="NDJSON stream of fetch_data --stream ('-' to read stdin), "
+    "processed while it is written",
+)
+@shard_options
+@click.option(
+    "--scenarios",
+    "scenarios_path",
+    type=click.Path(exists=True, dir_okay=False),
+    help="CSV file of model parameters (base, umbrella_profit, opening, closing) "
+    "for which the total profits are computed",
+)
+@output_options
+@click.option("--no_plot", is_flag=True, help="Only save the values, without plots")
+@click.option(
+    "--plot_processes",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of processes rendering the plots of the batch mode",
+)
+def main(
+    input_data: str,
+    input_file: IO[str],
+    input_stream: Optional[IO[str]],
+    shard_index: int,
+    shard_count: int,
+    scenarios_path: str,
+    output_format: str,
+    no_plot: bool,
+    plot_processes: int,
+):
+    # add and configure logging
+    logging.basicConfig(level=logging.INFO)
+
+    if input_stream is not None:
+        if input_data is not None or input_file is not None or scenarios_path:
+            raise click.UsageError(
+                "--input_stream cannot be used with --input_data, --input_path "
+                "or --scenarios"
+            )
+        data = predict_stream(input_stream, plot=not no_plot, plot_processes=plot_processes)
+        save_values(data, os.path.join(TEMP_OUTPUT_DIR, VALUES_FILES[output_format]))
+        metrics.write()
+        return
+
+    logger.info("Importing data")
+    import_data = load_input(input_data, input_file)
+    logger.info(f"Data imported: {import_data}")
+    if shard_count > 1:
+        if "locations" not in import_data:
+            raise click.UsageError("Only the values of the batch mode can be sharded")
+        import_data = shard_values(import_data, shard_index, shard_count)
+        logger.info(f"Shard {shard_index}/{shard_count}")
+
+    data = predict(
+        import_data,
+        scenarios_path,
+        plot=not no_plot,
+        plot_processes=plot_processes,
+        # The cube of the gridded mode is next to the input values.json
+        # (in data/ when it is read from stdin)
+        grid_dir=(
+            os.path.dirname(input_file.name)
+            if input_file is not None and os.path.isfile(input_file.name)
+            else TEMP_OUTPUT_DIR
+        ),
+    )
+    save_values(data, os.path.join(TEMP_OUTPUT_DIR, VALUES_FILES[output_format]))
+    metrics.write()
+
+
+# Calculate the anticipated profits from the output of fetch_data,
+# save the plot and return the content of values.json
+@metrics.stage("prediction")
+def predict(
+    import_data: dict,
+    scenarios_path: Optional[str] = None,
+    plot: bool = True,
+    plot_processes: int = 1,
+    grid_dir: str = TEMP_OUTPUT_DIR,
+) -> dict:
+    logger.info("Creating output directory")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(TEMP_OUTPUT_DIR, exist_ok=True)
+
+    local_time = parse_times(import_data["local_time"])
+    logger.info(f"Local time: {local_time} with length: {len(local_time)}")
+    pixel_value =  import_data["pixel_value"]
+    logger.info(f"Pixel value: {pixel_value} with length: {len(pixel_value)}")
+    interval = import_data["interval"]
+    logger.info(f"Interval: {interval}")
+
+    logger.info(f"Opening hours: {OPENING}:00 - Closing hours: {CLOSING}:00")
+
+    # Prediction times that are within the open hours
+    open_hours = [
+        timestep
+        for timestep, is_open in zip(local_time, open_hours_mask(local_time))
+        if is_open
+    ]
+
+    # Number of umbrellas sold and anticipated profits
+    # depending on precipitations probability
+    # (pixel_value holds one list per location in batch mode)
+    logger.info("Calculating the cumulative profits")
+    cumulative_profit_values = cumulative_profit(local_time, pixel_value, interval)
+
+    if scenarios_path is not None:
+        scenarios = read_scenarios(scenarios_path)
+        check_scenario_hours(scenarios, import_data.get("business_hours"))
+        logger.info(f"Calculating the profits of {len(scenarios['base'])} scenarios")
+        total_profit = cumulative_profit(local_time, pixel_value, interval, **scenarios)
+        with open(os.path.join(TEMP_OUTPUT_DIR, "scenarios.json"), "w") as file:
+            json.dump(
+                {
+                    "scenarios": {name: value.tolist() for name, value in scenarios.items()},
+                    # Total profits per scenario (and per location in batch mode)
+                    "total_profit": total_profit[..., -1].tolist(),
+                },
+                file,
+            )
+        logger.info("Scenarios saved")
+
+    if plot:
+        save_prediction_plots(
+            local_time,
+            pixel_value,
+            cumulative_profit_values,
+            import_data.get("locations"),
+            plot_processes,
         )
 
+    data = {
+        "local_time": import_data["local_time"],
+        "pixel_value": pixel_value,
+        "cumulative_profit": cumulative_profit_values.tolist(),
+        "open_hours": [hour.strftime("%Y-%m-%d %H:%M:%S") for hour in open_hours],
+        "layer": import_data["layer"],
+        "bbox": import_data["bbox"],
+        "start_time": import_data["start_time"],
+        "end_time": import_data["end_time"],
+    }
+    if "locations" in import_data:
+        data["locations"] = import_data["locations"]
+    if "shard" in import_data:
+        data["shard"] = import_data["shard"]
+
+    if "exceedance" in import_data:
+        # Profits from the distribution of the quantity of precipitations
+        thresholds = import_data["thresholds"]
+        logger.info(f"Calculating the expected profits of {len(thresholds)} thresholds")
+        data["thresholds"] = thresholds
+        data["expected_profit"] = expected_profit(
+            local_time, import_data["exceedance"], thresholds, interval
+        ).tolist()
+
+    if "grid" in import_data:
+        # Aggregates over the whole bbox of the gridded mode
+        cube = numpy.load(
+            os.path.join(grid_dir, import_data["grid"]["path"]), mmap_mode="r"
+        )
+        logger.info(f"Calculating the regional aggregates of a {cube.shape} grid")
+        aggregates = regional_aggregates(cube)
+        data["grid"] = import_data["grid"]
+        data["regional"] = {
+            "threshold": AREA_THRESHOLD,
+            **{name: values.tolist() for name, values in aggregates.items()},
+        }
+    return data
+
+
+# Create and save the plots (one per location in batch mode)
+def save_prediction_plots(
+    local_time: list[datetime],
+    pixel_value,
+    cumulative_profit_values: numpy.ndarray,
+    locations: Optional[list[dict]] = None,
+    plot_processes: int = 1,
+) -> None:
+    logger.info("Creating the plots")
+    if cumulative_profit_values.ndim == 1:
+        plots = [
+            (
+                os.path.join(OUTPUT_DIR, "prediction.png"),
+                prediction_plot(local_time, pixel_value, cumulative_profit_values),
+            )
+        ]
+    else:
+        plots = [
+            (
+                os.path.join(OUTPUT_DIR, f"prediction-{location['name']}.png"),
+                prediction_plot(local_time, values, profits),
+            )
+            for location, values, profits in zip(
+                locations, pixel_value, cumulative_profit_values
+            )
+        ]
+    save_figs(plots, processes=plot_processes)
+    logger.info("Plots saved")
+
+
+# Calculate the anticipated profits from the NDJSON stream of fetch_data,
+# record by record while the stream is written, and return the content
+# of values.json (the same as predict for the same values)
+@metrics.stage("prediction")
+def predict_stream(
+    lines: Iterable[str], plot: bool = True, plot_processes: int = 1
+) -> dict:
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(TEMP_OUTPUT_DIR, exist_ok=True)
+
+    records = (json.loads(line) for line in lines if line.strip())
+    header = next(records, None)
+    if header is None:
+        raise click.ClickException("The stream is empty")
+    interval = header["interval"]
+    logger.info(f"Interval: {interval}")
+    logger.info(f"Opening hours: {OPENING}:00 - Closing hours: {CLOSING}:00")
+
+    accumulator = ProfitAccumulator(interval)
+    local_time, pixel_value, profits = [], [], []
+    for record in records:
+        loc_time = datetime.strptime(record["local_time"], TIME_FORMAT)
+        profit = accumulator.add(loc_time, record["pixel_value"])
+        local_time.append(loc_time)
+        pixel_value.append(record["pixel_value"])
+        profits.append(profit)
+        logger.debug(f"{record['local_time']}: cumulative profits {profit}")
+    logger.info(f"{len(local_time)} timesteps received")
+    if not local_time:
+        raise click.ClickException("The stream holds no timestep")
+
+    # Timesteps on the last axis, as in values.json
+    pixel_value = numpy.asarray(pixel_value, dtype=float).T.tolist()
+    cumulative_profit_values = numpy.asarray(profits, dtype=float).T
+    open_hours = [
+        timestep
+        for timestep, is_open in zip(local_time, open_hours_mask(local_time))
+        if is_open
+    ]
+
+    if plot:
+        save_prediction_plots(
+            local_time,
+            pixel_value,
+            cumulative_profit_values,
+            header.get("locations"),
+            plot_processes,
+        )
+
+    data = {
+        "local_time": [loc_time.strftime(TIME_FORMAT) for loc_time in local_time],
+        "pixel_value": pixel_value,
+        "cumulative_profit": cumulative_profit_values.tolist(),
+        "open_hours": [hour.strftime(TIME_FORMAT) for hour in open_hours],
+        "layer": header["layer"],
+        "bbox": header["bbox"],
+        "start_time": header["start_time"],
+        "end_time": header["end_time"],
+    }
+    for key in ("locations", "shard"):
+        if key in header:
+            data[key] = header[key]
+    return data
+
+
 if __name__ == "__main__":
     main()
@@ -1,69 +1,81 @@
 # Importation of Python modules
-import json
-from datetime import datetime
+from typing import IO
 import logging
 import os
+import shutil
 
-import pandas
 import click
 
+from dataio import input_options, load_input
+import metrics
 
-# add and configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 OUTPUT_DIR = os.path.join("./", "plots")
 
-logger.info("Creating output directory")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
 @click.command()
-@click.option("--input_data", required=True, type=str)
-def main(input_data: str):
-    logger.info("Importing data from the command line")
+@input_options
+def main(input_data: str, input_file: IO[str]):
+    # add and configure logging
+    logging.basicConfig(level=logging.INFO)
+
+    logger.info("Importing data")
 
-    import_data = json.loads(input_data)
+    import_data = load_input(input_data, input_file)
     logger.info(f"Data imported: {import_data}")
 
-    local_time = [
-        datetime.strptime(loc_time, "%Y-%m-%d %H:%M:%S")
-        for loc_time in import_data["local_time"]
-    ]
-    logger.info(f"Local time: {local_time} with length: {len(local_time)}")
+    profit_table(import_data)
+    metrics.write()
+
+
+# Save the table of the anticipated profits within open hours
+# from the output of prediction (one row per location and open hour)
+@metrics.stage("profit")
+def profit_table(import_data: dict) -> None:
+    import numpy
+    import pandas
+
+    logger.info("Creating output directory")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    local_time = pandas.to_datetime(import_data["local_time"], format="%Y-%m-%d %H:%M:%S")
+    logger.info(f"Local time: {len(local_time)} timesteps")
 
-    pixel_value = import_data["pixel_value"]
-    logger.info(f"Pixel value: {pixel_value} with length: {len(pixel_value)}")
+    # One row per location (a single row outside of the batch mode)
+    pixel_value = numpy.atleast_2d(numpy.asarray(import_data["pixel_value"], dtype=float))
+    logger.info(f"Pixel value: {pixel_value.shape[0]} locations")
 
-    open_hours = [datetime.strptime(open_hour, "%Y-%m-%d %H:%M:%S") for open_hour in import_data["open_hours"]]
-    logger.info(f"Open hours: {open_hours}")
+    open_hours = pandas.to_datetime(import_data["open_hours"], format="%Y-%m-%d %H:%M:%S")
+    logger.info(f"Open hours: {len(open_hours)} timesteps")
+
+    cumulative_profit = numpy.atleast_2d(
+        numpy.asarray(import_data["cumulative_profit"], dtype=float)
+    )
 
-    cumulative_profit = import_data["cumulative_profit"]
-    logger.info(f"Cumulative profit: {cumulative_profit}")
-    
     # Probability of precipitations and cumulative
     # profits only within open hours
-    probability = []
-    profit = []
-    for index, timestep in enumerate(local_time):
-        if timestep in open_hours:
-            probability.append(pixel_value[index])
-            profit.append(cumulative_profit[index])
+    is_open = local_time.isin(open_hours)
+    probability = pixel_value[:, is_open]
+    profit = cumulative_profit[:, is_open]
+    locations = len(probability)
 
     # Create table
-    profit_df = pandas.DataFrame(
-        {
-            "Local date and time": open_hours,
-            "Probability (%)": probability,
-            "Anticipated cumulative profits ($)": profit,
-        }
-    )
+    table = {
+        "Local date and time": numpy.tile(local_time[is_open], locations),
+        "Probability (%)": probability.ravel(),
+        "Anticipated cumulative profits ($)": profit.ravel(),
+    }
+    if "locations" in import_data:
+        names = [location["name"] for location in import_data["locations"]]
+        table = {"Location": numpy.repeat(names, is_open.sum()), **table}
+    profit_df = pandas.DataFrame(table)
 
     # Show table
     logger.info(
         "Anticipated profits from umbrellas sales depending on precipitations probability"
     )
 
-    # Save in CSV format (remove # from the following lines)
+    # Save in CSV format
     logger.info("Saving table in CSV format")
     profit_df.to_csv(
         os.path.join(OUTPUT_DIR, "profit.csv"),
@@ -72,6 +84,20 @@ def main(input_data: str):
         encoding="utf-8-sig",
     )
 
+    # Save in Parquet format, partitioned by location in batch mode
+    # (a partitioned dataset is a directory, any previous output is replaced)
+    logger.info("Saving table in Parquet format")
+    parquet_path = os.path.join(OUTPUT_DIR, "profit.parquet")
+    if os.path.isdir(parquet_path):
+        shutil.rmtree(parquet_path)
+    elif os.path.exists(parquet_path):
+        os.remove(parquet_path)
+    profit_df.to_parquet(
+        parquet_path,
+        index=False,
+        partition_cols=["Location"] if "Location" in profit_df else None,
+    )
+
     logger.info("Table saved")
 
 if __name__ == "__main__":
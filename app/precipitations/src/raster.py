@@ -0,0 +1,171 @@
+# Importation of Python modules
+from dataclasses import dataclass
+from datetime import datetime
+from io import BytesIO
+from typing import Iterator, Optional
+import math
+
+# The following modules must first be installed to use
+# this code out of Jupyter Notebook
+import numpy
+
+from geomet import GeoMetClient
+
+# Size in degrees of a pixel of the requested rasters
+RASTER_RESOLUTION = 0.05
+# Largest width or height of a requested raster
+MAX_RASTER_SIZE = 4096
+
+
+# Bounding box covering all the locations with a margin around them
+def union_bbox(
+    x: numpy.ndarray, y: numpy.ndarray, margin: float = 0.25
+) -> tuple[float, float, float, float]:
+    return (
+        float(x.min()) - margin,
+        float(y.min()) - margin,
+        float(x.max()) + margin,
+        float(y.max()) + margin,
+    )
+
+
+# Width and height of a raster covering the bbox at the given resolution
+def raster_size(
+    bbox: tuple[float, float, float, float], resolution: float = RASTER_RESOLUTION
+) -> tuple[int, int]:
+    min_x, min_y, max_x, max_y = bbox
+    width = math.ceil((max_x - min_x) / resolution)
+    height = math.ceil((max_y - min_y) / resolution)
+    return min(max(width, 1), MAX_RASTER_SIZE), min(max(height, 1), MAX_RASTER_SIZE)
+
+
+# Row and column of the pixel containing each location
+# (the first row of the raster is the northern edge of the bbox)
+def pixel_indices(
+    x: numpy.ndarray,
+    y: numpy.ndarray,
+    bbox: tuple[float, float, float, float],
+    size: tuple[int, int],
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    min_x, min_y, max_x, max_y = bbox
+    width, height = size
+    cols = numpy.floor((x - min_x) / (max_x - min_x) * width).astype(numpy.intp)
+    rows = numpy.floor((max_y - y) / (max_y - min_y) * height).astype(numpy.intp)
+    return numpy.clip(rows, 0, height - 1), numpy.clip(cols, 0, width - 1)
+
+
+# Modes of the images holding the values of a single band
+# (float and integer GeoTIFF)
+VALUE_MODES = ("F", "I", "I;16", "I;16B", "I;16L")
+
+# TIFF tag in which GDAL writes the value of the pixels without data
+GDAL_NODATA_TAG = 42113
+
+
+# Single band raster (e.g. float GeoTIFF) decoded as a 2-D array, the
+# pixels without data being NaN as in the GetFeatureInfo answers. Rendered
+# images (paletted, RGB or RGBA) hold colors, not values, and are refused.
+def decode_raster(content: bytes) -> numpy.ndarray:
+    from PIL import Image
+
+    with Image.open(BytesIO(content)) as image:
+        if image.mode not in VALUE_MODES:
+            raise ValueError(
+                f"The raster is a {image.mode} image, not a single band of values"
+            )
+        raster = numpy.asarray(image, dtype=numpy.float32)
+        nodata = getattr(image, "tag_v2", {}).get(GDAL_NODATA_TAG)
+    if nodata is not None:
+        nodata = float(str(nodata).strip("\x00 "))
+        raster = numpy.where(raster == numpy.float32(nodata), numpy.nan, raster)
+    return raster
+
+
+@dataclass
+class RasterRequestInput:
+    layer: str
+    time: list[datetime]
+    x: numpy.ndarray
+    y: numpy.ndarray
+    bbox: tuple[float, float, float, float]
+    client: GeoMetClient
+    format: str = "image/tiff"
+
+
+# One GetCoverage query per timestep covering all the locations, the values
+# of every location are sampled from the raster at once
+# (returns an array of shape (locations, timesteps))
+def request_raster(input: RasterRequestInput) -> numpy.ndarray:
+    return numpy.stack(list(raster_stream(input)), axis=1)
+
+
+# Values of all the locations at every timestep, yielded in order
+# as soon as the raster of the timestep is fetched
+def raster_stream(input: RasterRequestInput) -> Iterator[numpy.ndarray]:
+    size = raster_size(input.bbox)
+    rows, cols = pixel_indices(input.x, input.y, input.bbox, size)
+
+    def fetch(timestep: datetime) -> numpy.ndarray:
+        # WCS GetCoverage query
+        content = input.client.getcoverage(
+            layer=input.layer,
+            bbox=input.bbox,
+            time=timestep,
+            size=size,
+            format=input.format,
+        )
+        return decode_raster(content)[rows, cols]
+
+    return input.client.imap(fetch, input.time)
+
+
+# Longitude of the center of every column and latitude of the center
+# of every row of a raster (the first row is the northern edge)
+def grid_coordinates(
+    bbox: tuple[float, float, float, float], size: tuple[int, int]
+) -> tuple[numpy.ndarray, numpy.ndarray]:
+    min_x, min_y, max_x, max_y = bbox
+    width, height = size
+    x = min_x + (numpy.arange(width) + 0.5) * (max_x - min_x) / width
+    y = max_y - (numpy.arange(height) + 0.5) * (max_y - min_y) / height
+    return x, y
+
+
+@dataclass
+class CubeRequestInput:
+    layer: str
+    time: list[datetime]
+    bbox: tuple[float, float, float, float]
+    client: GeoMetClient
+    format: str = "image/tiff"
+
+
+# One GetCoverage query per timestep, the rasters of the bbox are stacked in a
+# cube of shape (timesteps, rows, columns). With a path, the cube is a
+# .npy file memory-mapped on disk, so that its size is not limited by
+# the memory.
+def request_cube(input: CubeRequestInput, path: Optional[str] = None) -> numpy.ndarray:
+    width, height = raster_size(input.bbox)
+    shape = (len(input.time), height, width)
+    if path is None:
+        cube = numpy.empty(shape, dtype=numpy.float32)
+    else:
+        cube = numpy.lib.format.open_memmap(
+            path, mode="w+", dtype=numpy.float32, shape=shape
+        )
+
+    def fetch(index: int) -> None:
+        # WCS GetCoverage query
+        content = input.client.getcoverage(
+            layer=input.layer,
+            bbox=input.bbox,
+            time=input.time[index],
+            size=(width, height),
+            format=input.format,
+        )
+        cube[index] = decode_raster(content)
+
+    input.client.map(fetch, range(len(input.time)))
+    if path is not None:
+        cube.flush()
+    return cube
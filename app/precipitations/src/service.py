@@ -0,0 +1,235 @@
+# Importation of Python modules
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+import json
+import logging
+import threading
+import time
+
+# The following modules must first be installed to use
+# this code out of Jupyter Notebook
+import click
+import requests
+
+from business_hours import business_timesteps
+from capabilities import layer_grid, layer_reference_time
+from fetch_data import LAYER, RequestInput, forecast_times, request, time_parameters
+from geomet import GeoMetClient
+from locations import grid_cell
+import metrics
+from prediction import cumulative_profit, open_hours_mask
+
+logger = logging.getLogger(__name__)
+
+# Number of point forecasts kept in memory
+FORECAST_CACHE_SIZE = 1024
+
+
+# Least recently used point forecasts, shared by the request threads
+class ForecastCache:
+    def __init__(self, max_size: int = FORECAST_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries: OrderedDict[tuple, dict] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[dict]:
+        with self.lock:
+            forecast = self.entries.get(key)
+            if forecast is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return forecast
+
+    def put(self, key: tuple, forecast: dict) -> None:
+        with self.lock:
+            self.entries[key] = forecast
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+# Probabilities and anticipated profits at a point, computed like
+# fetch_data and prediction do for a single location
+def point_forecast(x: float, y: float, client: GeoMetClient, reference_time: str) -> dict:
+    start_time, end_time, interval = time_parameters(LAYER, client)
+    time, local_time = business_timesteps(*forecast_times(start_time, end_time, interval))
+    values = request(
+        RequestInput(
+            layers=[LAYER],
+            time=time,
+            min_x=x - 0.25,
+            min_y=y - 0.25,
+            max_x=x + 0.25,
+            max_y=y + 0.25,
+            client=client,
+            reference_time=reference_time,
+        )
+    )
+    pixel_value = values[LAYER]
+    is_open = open_hours_mask(local_time)
+    return {
+        "x": x,
+        "y": y,
+        "layer": LAYER,
+        "reference_time": reference_time,
+        "local_time": [loc_time.strftime("%Y-%m-%d %H:%M:%S") for loc_time in local_time],
+        "pixel_value": pixel_value,
+        "cumulative_profit": cumulative_profit(local_time, pixel_value, interval).tolist(),
+        "open_hours": [
+            loc_time.strftime("%Y-%m-%d %H:%M:%S")
+            for loc_time, open_hour in zip(local_time, is_open)
+            if open_hour
+        ],
+        "interval": interval,
+    }
+
+
+# Point forecasts answered from the memory: the time dimensions of the
+# layer are kept for the ttl of the capabilities and the forecasts of the
+# latest model run in a LRU cache. When the capabilities give the native
+# grid of the layer, the points in the same cell of the grid have the same
+# values and share a forecast.
+class ForecastService:
+    def __init__(self, client: GeoMetClient, cache_size: int = FORECAST_CACHE_SIZE):
+        self.client = client
+        self.cache = ForecastCache(cache_size)
+        # Distinct points asked and distinct locations (cells of the grid)
+        # forecast for the latest model run
+        self.lock = threading.Lock()
+        self.reference_time: Optional[str] = None
+        self.points: set[tuple[float, float]] = set()
+        self.locations: set[tuple] = set()
+
+    def forecast(self, x: float, y: float) -> tuple[dict, bool]:
+        # A new model run changes the key, older forecasts age out of the cache
+        reference_time = layer_reference_time(LAYER, self.client)
+        grid = layer_grid(LAYER, self.client)
+        location = (x, y) if grid is None else grid_cell(x, y, grid)
+        with self.lock:
+            if reference_time != self.reference_time:
+                self.reference_time = reference_time
+                self.points.clear()
+                self.locations.clear()
+            self.points.add((x, y))
+            self.locations.add(location)
+        key = (location, reference_time)
+        forecast = self.cache.get(key)
+        cached = forecast is not None
+        if not cached:
+            forecast = point_forecast(x, y, self.client, reference_time)
+            self.cache.put(key, forecast)
+        # The forecast may have been computed for another point of the cell
+        return {**forecast, "x": x, "y": y}, cached
+
+    # Forecasts answered and computed with GeoMet queries, and distinct
+    # points per distinct cell of the grid for the latest model run (the
+    # repeated requests of a point are cache hits, not deduplication)
+    def statistics(self) -> dict:
+        with self.lock:
+            points, locations = len(self.points), len(self.locations)
+        return {
+            "forecasts": self.cache.hits + self.cache.misses,
+            "computed": self.cache.misses,
+            "points": points,
+            "cells": locations,
+            "deduplication_ratio": points / locations if locations else None,
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self.answer(200, {"status": "ok", **self.server.service.statistics()})
+        if url.path != "/forecast":
+            return self.answer(404, {"error": f"Unknown path {url.path}"})
+
+        query = parse_qs(url.query)
+        try:
+            x = float(query["x"][0])
+            y = float(query["y"][0])
+        except (KeyError, ValueError):
+            return self.answer(400, {"error": "x and y coordinates are required"})
+
+        start = time.perf_counter()
+        try:
+            forecast, cached = self.server.service.forecast(x, y)
+        except (requests.RequestException, ValueError) as error:
+            logger.exception("Forecast failed")
+            return self.answer(502, {"error": f"GeoMet request failed: {error}"})
+        logger.info(
+            f"Forecast {x}, {y} in {(time.perf_counter() - start) * 1000:.1f} ms"
+            + (" (cached)" if cached else "")
+        )
+        return self.answer(200, forecast)
+
+    def answer(self, status: int, content: dict) -> None:
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    workers: int = 8,
+    cache_size: int = FORECAST_CACHE_SIZE,
+    client: Optional[GeoMetClient] = None,
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.service = ForecastService(client or GeoMetClient(workers=workers), cache_size)
+    return server
+
+
+# Long-running HTTP service answering /forecast?x=..&y=..
+@click.command()
+@click.option("--host", type=str, default="0.0.0.0", show_default=True)
+@click.option("--port", type=int, default=8080, show_default=True)
+@click.option(
+    "--workers",
+    type=int,
+    default=8,
+    show_default=True,
+    help="Number of concurrent WMS requests of a forecast",
+)
+@click.option(
+    "--cache_size",
+    type=int,
+    default=FORECAST_CACHE_SIZE,
+    show_default=True,
+    help="Number of point forecasts kept in memory",
+)
+def main(host: str, port: int, workers: int, cache_size: int) -> None:
+    # add and configure logging
+    logging.basicConfig(level=logging.INFO)
+
+    server = serve(host, port, workers, cache_size)
+    # Read the capabilities before the first forecast
+    layer_reference_time(LAYER, server.service.client)
+    if layer_grid(LAYER, server.service.client) is None:
+        logger.warning(
+            f"No native grid (resx/resy) published for {LAYER}, "
+            "the forecasts of points in the same cell are not shared"
+        )
+    logger.info(f"Serving forecasts on http://{host}:{server.server_address[1]}/forecast")
+    try:
+        server.serve_forever()
+    finally:
+        server.service.client.close()
+        metrics.write()
+
+
+if __name__ == "__main__":
+    main()
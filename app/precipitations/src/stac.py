@@ -2,28 +2,44 @@ import os
 import json
 import logging
 from uuid import uuid4
+from itertools import chain
 from datetime import datetime
+from typing import IO, Iterable
 
-import pystac
-import shapely
 import click
 
-# add and configure logging
-logging.basicConfig(level=logging.INFO)
+from dataio import input_options, load_input
+import metrics
+
 logger = logging.getLogger(__name__)
 
 OUTPUT_DIR = os.path.join("./", "stac-items")
-
-logger.info("Creating output directory")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+ITEMS_FILE = "items.ndjson"
 
 @click.command()
-@click.option("--input_data", required=True, type=str)
-def stac(input_data: str):
-    logger.info("Importing data from the command line")
-    import_data = json.loads(input_data)
+@input_options
+def main(input_data: str, input_file: IO[str]):
+    # add and configure logging
+    logging.basicConfig(level=logging.INFO)
+
+    logger.info("Importing data")
+    import_data = load_input(input_data, input_file)
     logger.info(f"Data imported: {import_data}")
 
+    stac(import_data)
+    metrics.write()
+
+
+# Write the STAC catalog, collection and item describing
+# the assets produced from the output of prediction
+@metrics.stage("stac")
+def stac(import_data: dict) -> None:
+    import pystac
+    import shapely
+
+    logger.info("Creating output directory")
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
     bbox = import_data["bbox"]
     logger.info(f"Bbox: {bbox}")
     logger.info(f"Bbox type: {type(bbox)}")
@@ -56,6 +72,11 @@ def stac(input_data: str):
 
     logger.info(f"Assets bucket path: {assets_bucket_path}")
 
+    if "locations" in import_data:
+        # Batch mode: one item per location
+        bulk_stac(import_data, assets_bucket_path, collection_id)
+        return
+
     # create Collection
     logger.info("Creating collection")
     collection = pystac.Collection(
@@ -122,6 +143,16 @@ def stac(input_data: str):
         )
     )
 
+    item.add_asset(
+        key="profit_parquet",
+        asset=pystac.Asset(
+            title="Profit (Parquet)",
+            href=os.path.join(assets_bucket_path, "profit.parquet"),
+            media_type=pystac.MediaType.PARQUET,
+            roles=["data"]
+        )
+    )
+
     # add item to catalog
     catalog.add_item(item)
 
@@ -158,5 +189,186 @@ def stac(input_data: str):
 
     logger.info("Catalog created successfully")
 
+
+def location_item_id(layer: str, location: dict) -> str:
+    return f"{layer}-{location['name']}"
+
+
+# Plain dict of the item of one location of the batch mode
+# (building pystac objects for thousands of items is much slower)
+def location_item(
+    location: dict,
+    layer: str,
+    start_time: datetime,
+    assets_bucket_path: str,
+    collection_id: str,
+) -> dict:
+    import pystac
+
+    item_id = location_item_id(layer, location)
+    x, y = location["x"], location["y"]
+
+    def link(rel: str, path: str, media_type: str) -> dict:
+        return {
+            "rel": rel,
+            "href": os.path.join(assets_bucket_path, path),
+            "type": media_type,
+        }
+
+    def asset(title: str, path: str, media_type: str, roles: list[str]) -> dict:
+        return {
+            "href": os.path.join(assets_bucket_path, path),
+            "type": media_type,
+            "title": title,
+            "roles": roles,
+        }
+
+    return {
+        "type": "Feature",
+        "stac_version": pystac.get_stac_version(),
+        "id": item_id,
+        "geometry": {"type": "Point", "coordinates": [x, y]},
+        "bbox": [x, y, x, y],
+        "properties": {
+            "datetime": start_time.isoformat() + "Z",
+            "location": location["name"],
+        },
+        # Absolute links, the same item is also a line of items.ndjson
+        "links": [
+            link("root", "catalog.json", pystac.MediaType.JSON),
+            link("collection", "collection.json", pystac.MediaType.JSON),
+            link("parent", "collection.json", pystac.MediaType.JSON),
+            {
+                "rel": "self",
+                "href": os.path.join(assets_bucket_path, item_id, f"{item_id}.json"),
+                "type": pystac.MediaType.GEOJSON,
+            },
+        ],
+        "assets": {
+            "probability_of_rain": asset(
+                "Probability of rain",
+                f"probability_of_rain-{location['name']}.png",
+                pystac.MediaType.PNG,
+                ["data", "visual"],
+            ),
+            "predicted_profit": asset(
+                "Predicted profit",
+                f"prediction-{location['name']}.png",
+                pystac.MediaType.PNG,
+                ["data", "visual"],
+            ),
+            "profit": asset(
+                "Profit", "profit.csv", pystac.MediaType.TEXT, ["data", "visual"]
+            ),
+            "profit_parquet": asset(
+                "Profit (Parquet)",
+                f"profit.parquet/Location={location['name']}",
+                pystac.MediaType.PARQUET,
+                ["data"],
+            ),
+        },
+        "collection": collection_id,
+        "stac_extensions": [],
+    }
+
+
+# Write a collection whose links end with the item links, written one at
+# a time as they are generated instead of being held in a list
+def write_collection(path: str, collection: dict, item_links: Iterable[dict]) -> None:
+    links = collection.pop("links")
+    with open(path, "w") as file:
+        # The links are the last entry of the collection object
+        file.write(json.dumps(collection)[:-1] + ', "links": [')
+        for index, link in enumerate(chain(links, item_links)):
+            file.write((", " if index else "") + json.dumps(link))
+        file.write("]}")
+
+
+# Write the items of all the locations of the batch mode in a single pass:
+# every item is streamed to items.ndjson and to its own item file as soon
+# as it is built, only the collection extent is kept in memory. The
+# catalog and the collection (whose item links are generated again from
+# the locations) are written last.
+def bulk_stac(import_data: dict, assets_bucket_path: str, collection_id: str) -> None:
+    import pystac
+
+    layer = import_data["layer"]
+    start_time = datetime.strptime(import_data["start_time"], "%Y-%m-%d %H:%M:%S")
+    end_time = datetime.strptime(import_data["end_time"], "%Y-%m-%d %H:%M:%S")
+
+    logger.info(f"Writing {len(import_data['locations'])} items")
+    min_x = min_y = float("inf")
+    max_x = max_y = float("-inf")
+    with open(os.path.join(OUTPUT_DIR, ITEMS_FILE), "w") as items_file:
+        for location in import_data["locations"]:
+            item = location_item(
+                location, layer, start_time, assets_bucket_path, collection_id
+            )
+            line = json.dumps(item)
+            items_file.write(line + "\n")
+
+            item_dir = os.path.join(OUTPUT_DIR, item["id"])
+            os.makedirs(item_dir, exist_ok=True)
+            with open(os.path.join(item_dir, f"{item['id']}.json"), "w") as file:
+                file.write(line)
+
+            # Extent of the collection
+            x, y = location["x"], location["y"]
+            min_x, max_x = min(min_x, x), max(max_x, x)
+            min_y, max_y = min(min_y, y), max(max_y, y)
+
+    logger.info("Creating collection")
+    collection = pystac.Collection(
+        id=collection_id,
+        description="rain-forecast",
+        title="Rain forecast",
+        extent=pystac.Extent(
+            spatial=pystac.SpatialExtent([[min_x, min_y, max_x, max_y]]),
+            temporal=pystac.TemporalExtent(intervals=[[start_time, end_time]]),
+        ),
+        stac_extensions=[],
+        keywords=["DEC"],
+        license="proprietary",
+    )
+    # Every item of the collection in a single file
+    collection.add_asset(
+        "items",
+        pystac.Asset(
+            title="Items",
+            href=os.path.join(assets_bucket_path, ITEMS_FILE),
+            media_type="application/x-ndjson",
+            roles=["metadata"],
+        ),
+    )
+
+    catalog = pystac.Catalog(id="catalog", description="rain-forecast")
+    catalog.add_child(collection)
+    # Same layout as the single location mode: the catalog, the collection
+    # and the item directories side by side
+    catalog.set_self_href(os.path.join(assets_bucket_path, "catalog.json"))
+    collection.set_self_href(os.path.join(assets_bucket_path, "collection.json"))
+
+    item_ids = (
+        location_item_id(layer, location) for location in import_data["locations"]
+    )
+    item_links = (
+        {
+            "rel": "item",
+            "href": f"./{item_id}/{item_id}.json",
+            "type": pystac.MediaType.GEOJSON,
+        }
+        for item_id in item_ids
+    )
+    collection_path = os.path.join(OUTPUT_DIR, "collection.json")
+    logger.info(f"Writing collection to {collection_path}")
+    write_collection(collection_path, collection.to_dict(), item_links)
+
+    catalog_path = os.path.join(OUTPUT_DIR, "catalog.json")
+    logger.info(f"Writing catalog to {catalog_path}")
+    pystac.write_file(catalog, dest_href=catalog_path)
+
+    logger.info("Catalog created successfully")
+
+
 if __name__ == "__main__":
-    stac()
\ No newline at end of file
+    main()
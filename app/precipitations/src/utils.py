@@ -1,10 +1,11 @@
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import numpy
+# matplotlib and numpy are imported when a plot is created, so that
+# the stages do not pay their import time when nothing is plotted
 
 
 # Function to adjust the alignment of two y axis
 def align_yaxis(ax, ax2):
+    import numpy
+
     y_lims = numpy.array([ax.get_ylim() for ax in [ax, ax2]])
 
     # Normalize both y axis
@@ -21,26 +22,32 @@ def align_yaxis(ax, ax2):
     ax2.set_ylim(new_lim2)
 
 
+# Plot and text size parameters
+PARAMS = {
+    "legend.fontsize": "14",
+    "figure.figsize": (8, 6),
+    "axes.labelsize": "14",
+    "axes.titlesize": "16",
+    "xtick.labelsize": "12",
+    "ytick.labelsize": "12",
+}
+
+
 # Function to create the plot
+# (the figure is not registered with pyplot: it uses the Agg canvas
+# and is released as soon as it is no longer referenced)
 def fig(x, y, title, xlabel, ylabel, ylim, color="black", y2="", y2label=""):
-    # Plot and text size parameters
-    params = {
-        "legend.fontsize": "14",
-        "figure.figsize": (8, 6),
-        "axes.labelsize": "14",
-        "axes.titlesize": "16",
-        "xtick.labelsize": "12",
-        "ytick.labelsize": "12",
-    }
-    plt.rcParams.update(params)
+    import matplotlib.dates as mdates
+    from matplotlib.figure import Figure
 
     # Plot creation and plot styling
-    fig, ax = plt.subplots()
+    fig = Figure()
+    ax = fig.subplots()
     ax.plot(x, y, marker="o")
 
     # Titles
-    plt.title(title)
-    plt.xlabel(xlabel)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
     ax.set_ylabel(ylabel, color=color)
 
     # Y axis range
@@ -48,11 +55,11 @@ def fig(x, y, title, xlabel, ylabel, ylim, color="black", y2="", y2label=""):
     ax.tick_params(axis="y", labelcolor=color)
 
     # Grid
-    plt.grid(True, which="both")
+    ax.grid(True, which="both")
 
     # Add a second dataset
     if y2 is not None:
-        ax2 = plt.twinx()
+        ax2 = ax.twinx()
         ax2.plot(x, y2, marker="o", color="tab:red")
         # Second y axis title
         ax2.set_ylabel(y2label, color="tab:red")
@@ -62,21 +69,19 @@ def fig(x, y, title, xlabel, ylabel, ylim, color="black", y2="", y2label=""):
         align_yaxis(ax, ax2)
 
     # Date format on x axis
-    plt.gcf().autofmt_xdate()
+    fig.autofmt_xdate()
     my_format = mdates.DateFormatter("%m/%d %H:%M")
-    plt.gca().xaxis.set_major_formatter(my_format)
+    ax.xaxis.set_major_formatter(my_format)
 
     # Graduation of x axis depending on the number of values plotted
-    # Variable containing the hours for which there will be ticks:
-    hour = []
-    for timestep in x:
-        hour.append(int(timestep.strftime("%H")))
+    # Hours for which there will be ticks:
+    hour = sorted({timestep.hour for timestep in x})
 
     # Frequency of ticks and labels on the x axis
-    if len(hour) < 8:
+    if len(x) < 8:
         # More precise graduation if there is only a few values plotted
         ax.xaxis.set_major_locator(mdates.HourLocator(byhour=hour))
-    elif len(hour) > 8 and len(hour) < 25:
+    elif len(x) > 8 and len(x) < 25:
         ax.xaxis.set_major_locator(mdates.HourLocator(byhour=hour, interval=2))
         ax.xaxis.set_minor_locator(mdates.HourLocator(byhour=hour))
     else:
@@ -85,3 +90,33 @@ def fig(x, y, title, xlabel, ylabel, ylim, color="black", y2="", y2label=""):
         ax.xaxis.set_minor_locator(mdates.HourLocator(byhour=(0, 12)))
 
     return fig
+
+
+# Create the plot and save it to path. The text size parameters are only
+# applied while the plot is drawn, the global rcParams are left untouched.
+def save_fig(path: str, **kwargs) -> None:
+    import matplotlib
+
+    with matplotlib.rc_context(PARAMS):
+        figure = fig(**kwargs)
+        figure.savefig(path)
+
+
+def _save_fig(plot: tuple[str, dict]) -> None:
+    path, kwargs = plot
+    save_fig(path, **kwargs)
+
+
+# Save many plots, given as (path, fig arguments) pairs, in parallel
+# worker processes when processes > 1
+def save_figs(plots: list[tuple[str, dict]], processes: int = 1) -> None:
+    if processes <= 1 or len(plots) < 2:
+        for plot in plots:
+            _save_fig(plot)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, len(plots) // (4 * processes))
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        list(executor.map(_save_fig, plots, chunksize=chunksize))
@@ -0,0 +1,146 @@
+# Importation of Python modules
+from datetime import datetime
+from typing import Optional
+import logging
+import math
+import os
+import sqlite3
+import time
+
+from capabilities import CACHE_DIR
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = "values.sqlite"
+
+# Largest size of the cached values before the least recently used are evicted
+VALUE_CACHE_SIZE = 64 * 1024 * 1024
+
+
+# Persistent cache of the values returned by GeoMet. The values of a model
+# run never change, so they are kept until a newer run of the same layer
+# is requested or the cache grows over `max_size` bytes.
+class ValueCache:
+    def __init__(self, cache_dir: str = CACHE_DIR, max_size: int = VALUE_CACHE_SIZE):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, CACHE_FILE)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS value_cache (
+                layer TEXT NOT NULL,
+                reference_time TEXT NOT NULL,
+                time TEXT NOT NULL,
+                location TEXT NOT NULL,
+                value REAL,
+                size INTEGER NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (layer, reference_time, time, location)
+            )
+            """
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS value_cache_accessed ON value_cache (accessed)"
+        )
+        self.connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    # Drop the values of the runs of the layer older than reference_time
+    def invalidate(self, layer: str, reference_time: str) -> None:
+        deleted = self.connection.execute(
+            "DELETE FROM value_cache WHERE layer = ? AND reference_time < ?",
+            (layer, reference_time),
+        ).rowcount
+        self.connection.commit()
+        if deleted:
+            logger.info(f"{deleted} cached values of previous {layer} runs removed")
+
+    # Cached values of the layer for the timesteps, None when not cached
+    def get(
+        self,
+        layer: str,
+        reference_time: str,
+        timesteps: list[datetime],
+        location: str,
+    ) -> list[Optional[float]]:
+        keys = [timestep.isoformat() for timestep in timesteps]
+        values: dict[str, float] = {}
+        # Stay below the SQLite limit on the number of query parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.connection.execute(
+                "SELECT time, value FROM value_cache"
+                " WHERE layer = ? AND reference_time = ? AND location = ?"
+                f" AND time IN ({','.join('?' * len(chunk))})",
+                (layer, reference_time, location, *chunk),
+            )
+            # SQLite stores NaN (nodata) as NULL
+            values.update(
+                (key, math.nan if value is None else value) for key, value in rows
+            )
+        if values:
+            self.connection.execute(
+                "UPDATE value_cache SET accessed = ?"
+                " WHERE layer = ? AND reference_time = ? AND location = ?",
+                (time.time(), layer, reference_time, location),
+            )
+            self.connection.commit()
+        self.hits += len(values)
+        self.misses += len(keys) - len(values)
+        metrics.observe_cache("values", len(values), len(keys) - len(values))
+        return [values.get(key) for key in keys]
+
+    def put(
+        self,
+        layer: str,
+        reference_time: str,
+        timesteps: list[datetime],
+        location: str,
+        values: list[float],
+    ) -> None:
+        now = time.time()
+        rows = []
+        for timestep, value in zip(timesteps, values):
+            key = timestep.isoformat()
+            # Approximate size of the row in the database
+            size = len(layer) + len(reference_time) + len(key) + len(location) + 24
+            rows.append((layer, reference_time, key, location, value, size, now))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO value_cache VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        self.connection.commit()
+        self.evict()
+
+    # Remove the least recently used values until the cache fits in max_size
+    def evict(self) -> None:
+        (size,) = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM value_cache"
+        ).fetchone()
+        if size <= self.max_size:
+            return
+        excess = size - self.max_size
+        rows = self.connection.execute(
+            "SELECT rowid, size FROM value_cache ORDER BY accessed"
+        )
+        evicted = []
+        for rowid, row_size in rows:
+            evicted.append((rowid,))
+            excess -= row_size
+            if excess <= 0:
+                break
+        rows.close()
+        self.connection.executemany("DELETE FROM value_cache WHERE rowid = ?", evicted)
+        self.connection.commit()
+        logger.info(f"{len(evicted)} least recently used values evicted from the cache")